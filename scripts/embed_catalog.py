@@ -0,0 +1,106 @@
+"""
+Offline precompute of movie plot embeddings (GigaChat / Ollama).
+
+Проходит по каталогу батчами с ограничением частоты HTTP-запросов (--rate
+считает каждый запрос, включая получение токена), сохраняет чекпоинт после
+каждого батча и пропускает фильмы, чей текст не изменился. Эмбеддинги берутся
+только у бэкенда из метки модели хранилища, без фолбэка на другой.
+После падения или ошибки квоты повторный запуск продолжает с места остановки.
+Онлайн-запросы затем эмбеддят только текст пользователя (RECO_MOVIE_EMBEDDINGS=<out>).
+
+Пример запуска:
+  python scripts/embed_catalog.py --catalog movies.json --out data/movie_embeddings --batch-size 16 --rate 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, List
+
+from movie_recommender import _movie_plot_text, dense_embed_for, dense_model_label
+from reco_embed_store import EmbeddingStore, text_hash
+
+
+def _load_catalog(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("movies", [])
+    return [m for m in data if isinstance(m, dict) and m.get("id") is not None]
+
+
+def embed_catalog(
+    movies: List[Dict[str, Any]],
+    out_dir: str,
+    batch_size: int = 16,
+    rate: float = 1.0,
+    max_retries: int = 5,
+) -> Dict[str, Any]:
+    """Embed all new/changed movies into the store at out_dir; returns a summary."""
+    model = dense_model_label()
+    store = EmbeddingStore.open(out_dir) or EmbeddingStore(out_dir, model)
+    if store.model != model:
+        print(f"EMBED_MODEL_CHANGED {store.model} -> {model}, re-embedding", file=sys.stderr)
+        store.reset(model)
+
+    pending = []
+    for movie in movies:
+        item_id = str(movie["id"])
+        text = _movie_plot_text(movie)
+        digest = text_hash(text)
+        if not store.is_current(item_id, digest):
+            pending.append((item_id, digest, text))
+    skipped = len(movies) - len(pending)
+
+    min_interval = 1.0 / rate if rate > 0 else 0.0
+    last_call = [0.0]
+
+    def throttle() -> None:
+        # Called before every HTTP request (OAuth token and each text), not once per batch
+        wait = last_call[0] + min_interval - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        last_call[0] = time.time()
+
+    done = 0
+    for start in range(0, len(pending), max(1, batch_size)):
+        batch = pending[start:start + max(1, batch_size)]
+        vectors = None
+        for attempt in range(max_retries + 1):
+            # Only the store's own backend: a fallback model would mix vector spaces
+            vectors = dense_embed_for(model, [text for _, _, text in batch], throttle)
+            if vectors is not None:
+                break
+            # Quota / network error: back off, then retry the same batch
+            time.sleep(min(60.0, 2.0 ** attempt))
+        if vectors is None:
+            store.checkpoint()
+            return {"ok": False, "error": "embedding backend unavailable", "embedded": done, "skipped": skipped, "remaining": len(pending) - done}
+        store.write([b[0] for b in batch], [b[1] for b in batch], vectors)
+        store.checkpoint()
+        done += len(batch)
+        print(f"EMBED_PROGRESS {done}/{len(pending)}", file=sys.stderr)
+
+    store.checkpoint()
+    return {"ok": True, "embedded": done, "skipped": skipped, "remaining": 0, "rows": len(store.ids), "dim": store.dim, "model": model}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Precompute movie plot embeddings")
+    parser.add_argument("--catalog", required=True, help="JSON file: list of movies or {\"movies\": [...]}")
+    parser.add_argument("--out", required=True, help="Embedding store directory")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=1.0, help="Max embedding API requests per second")
+    parser.add_argument("--max-retries", type=int, default=5)
+    args = parser.parse_args()
+
+    summary = embed_catalog(_load_catalog(args.catalog), args.out, args.batch_size, args.rate, args.max_retries)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary["ok"] else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,10 +7,20 @@ import uuid
 from typing import Callable, Dict, List, Tuple, Any, Optional
 import sys
 import re
-from collections import Counter
+import bisect
+import hashlib
+import threading
+from collections import Counter, OrderedDict
 
 import numpy as np
 
+from reco_chunked import ChunkedScorer
+from reco_cursor import DEFAULT_PAGE_SIZE, Page, RankingStore, catalog_fingerprint, profile_fingerprint
+from reco_embed_store import EmbeddingStore, text_hash
+from reco_reduce import active_reducer
+from reco_tokenize import tfidf_embeddings
+from reco_variants import rank_variants
+
 # Optional HTTP client (fallback to urllib if requests is missing)
 try:  # pragma: no cover - optional dep
     import requests  # type: ignore
@@ -19,6 +29,8 @@ except Exception:  # pragma: no cover
     import urllib.request
     _HAVE_REQUESTS = False
 
+_RANKINGS = RankingStore()
+
 
 def _normalize_text(text: str) -> str:
     """Normalize text for processing"""
@@ -27,46 +39,47 @@ def _normalize_text(text: str) -> str:
     return re.sub(r'[^\w\s]', ' ', str(text).lower()).strip()
 
 
+_GENRE_MAPPING: Dict[str, str] = {
+    # Russian to English
+    "боевик": "action",
+    "комедия": "comedy", 
+    "драма": "drama",
+    "ужасы": "horror",
+    "фантастика": "sci-fi",
+    "фэнтези": "fantasy",
+    "триллер": "thriller",
+    "детектив": "mystery",
+    "криминал": "crime",
+    "мелодрама": "romance",
+    "приключения": "adventure",
+    "семейный": "family",
+    "мультфильм": "animation",
+    "документальный": "documentary",
+    "биография": "biography",
+    "история": "history",
+    "военный": "war",
+    "вестерн": "western",
+    "музыка": "music",
+    "спорт": "sport",
+    # Common variations
+    "sci fi": "sci-fi",
+    "sci-fi": "sci-fi",
+    "sci_fi": "sci-fi",
+    "rom-com": "romance",
+    "rom com": "romance",
+    "romcom": "romance",
+}
+
+
 def _normalize_genres(genres: List[str]) -> List[str]:
     """Normalize genre names"""
     if not genres:
         return []
     
-    genre_mapping = {
-        # Russian to English
-        "боевик": "action",
-        "комедия": "comedy", 
-        "драма": "drama",
-        "ужасы": "horror",
-        "фантастика": "sci-fi",
-        "фэнтези": "fantasy",
-        "триллер": "thriller",
-        "детектив": "mystery",
-        "криминал": "crime",
-        "мелодрама": "romance",
-        "приключения": "adventure",
-        "семейный": "family",
-        "мультфильм": "animation",
-        "документальный": "documentary",
-        "биография": "biography",
-        "история": "history",
-        "военный": "war",
-        "вестерн": "western",
-        "музыка": "music",
-        "спорт": "sport",
-        # Common variations
-        "sci fi": "sci-fi",
-        "sci-fi": "sci-fi",
-        "sci_fi": "sci-fi",
-        "rom-com": "romance",
-        "rom com": "romance",
-        "romcom": "romance",
-    }
-    
     normalized = []
     for genre in genres:
         genre_lower = _normalize_text(genre)
-        mapped_genre = genre_mapping.get(genre_lower, genre_lower)
+        mapped_genre = _GENRE_MAPPING.get(genre_lower, genre_lower)
         normalized.append(mapped_genre)
     
     return list(set(normalized))  # Remove duplicates
@@ -119,6 +132,159 @@ def _calculate_year_similarity(user_year_pref: int, movie_year: int) -> float:
     return max(0.0, 1.0 - (decade_diff * 0.2))
 
 
+def _normalize_actor(name: str) -> str:
+    """Normalize actor name: lowercase, punctuation → spaces, single-spaced tokens"""
+    return " ".join(_normalize_text(name).split())
+
+
+def _actor_matches(query: str, cast_member: str) -> bool:
+    """Every token of the query is a prefix of some token of the cast member's name"""
+    q_tokens = _normalize_actor(query).split()
+    c_tokens = _normalize_actor(cast_member).split()
+    if not q_tokens or not c_tokens:
+        return False
+    return all(any(ct.startswith(qt) for ct in c_tokens) for qt in q_tokens)
+
+
+class MovieCatalogIndex:
+    """
+    Precompiled movie catalog for vectorized genre and cast matching.
+    - genres: bool one-hot matrix (movies × genres) → Jaccard for all movies at once
+    - cast: normalized actor vocabulary with exact and token-prefix postings
+      (int32 arrays of actor ids / movie rows)
+    """
+
+    def __init__(self, movies: List[Dict[str, Any]]) -> None:
+        self.n_movies = len(movies)
+
+        # Genres → one-hot matrix
+        self.genre_vocab: Dict[str, int] = {}
+        rows: List[int] = []
+        cols: List[int] = []
+        for i, movie in enumerate(movies):
+            for genre in _normalize_genres(movie.get("genres", [])):
+                rows.append(i)
+                cols.append(self.genre_vocab.setdefault(genre, len(self.genre_vocab)))
+        self.genre_matrix = np.zeros((self.n_movies, len(self.genre_vocab)), dtype=np.bool_)
+        self.genre_matrix[rows, cols] = True
+        self.genre_counts = self.genre_matrix.sum(axis=1).astype(np.int32)
+
+        # Cast → actor vocabulary, actor→movies and token→actors postings
+        self.actor_vocab: Dict[str, int] = {}
+        actor_movies: List[List[int]] = []
+        token_actors: Dict[str, List[int]] = {}
+        for i, movie in enumerate(movies):
+            for name in movie.get("cast", []) or []:
+                norm = _normalize_actor(name)
+                if not norm:
+                    continue
+                aid = self.actor_vocab.get(norm)
+                if aid is None:
+                    aid = len(self.actor_vocab)
+                    self.actor_vocab[norm] = aid
+                    actor_movies.append([])
+                    for tok in set(norm.split()):
+                        token_actors.setdefault(tok, []).append(aid)
+                actor_movies[aid].append(i)
+        self.actor_movies: List[np.ndarray] = [np.unique(np.array(m, dtype=np.int32)) for m in actor_movies]
+        self._tokens: List[str] = sorted(token_actors)
+        self._token_postings: List[np.ndarray] = [np.array(token_actors[t], dtype=np.int32) for t in self._tokens]
+
+    def genre_similarity(self, user_genres: List[str]) -> np.ndarray:
+        """Jaccard similarity of user genres against every movie"""
+        sims = np.zeros((self.n_movies,), dtype=np.float64)
+        user_set = _normalize_genres(user_genres)
+        if not user_set or self.n_movies == 0:
+            return sims
+        cols = [self.genre_vocab[g] for g in user_set if g in self.genre_vocab]
+        inter = self.genre_matrix[:, cols].sum(axis=1).astype(np.float64)
+        union = self.genre_counts + len(user_set) - inter
+        has_genres = self.genre_counts > 0
+        sims[has_genres] = inter[has_genres] / union[has_genres]
+        return sims
+
+    def match_actors(self, query: str) -> np.ndarray:
+        """Actor ids matching the query (exact name or token-prefix match)"""
+        q_tokens = _normalize_actor(query).split()
+        empty = np.zeros((0,), dtype=np.int32)
+        if not q_tokens:
+            return empty
+        exact = self.actor_vocab.get(" ".join(q_tokens))
+        candidates: Optional[np.ndarray] = None
+        for tok in q_tokens:
+            lo = bisect.bisect_left(self._tokens, tok)
+            hi = bisect.bisect_left(self._tokens, tok + "\uffff")
+            ids = np.unique(np.concatenate(self._token_postings[lo:hi])) if hi > lo else empty
+            candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+            if candidates.size == 0:
+                break
+        if exact is not None:
+            candidates = np.union1d(candidates, np.array([exact], dtype=np.int32))
+        return candidates.astype(np.int32) if candidates is not None else empty
+
+    def cast_similarity(self, favorite_actors: List[str]) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """
+        Share of favorite actors present in each movie's cast.
+        Also returns matched actor ids per favorite (for explanations).
+        """
+        sims = np.zeros((self.n_movies,), dtype=np.float64)
+        matched: List[np.ndarray] = []
+        if not favorite_actors or self.n_movies == 0:
+            return sims, matched
+        counts = np.zeros((self.n_movies,), dtype=np.int32)
+        for actor in favorite_actors:
+            aids = self.match_actors(actor)
+            matched.append(aids)
+            if aids.size:
+                rows = np.unique(np.concatenate([self.actor_movies[a] for a in aids.tolist()]))
+                counts[rows] += 1
+        np.minimum(1.0, counts / float(len(favorite_actors)), out=sims, casting="unsafe")
+        return sims, matched
+
+    def matching_cast(self, movie: Dict[str, Any], matched: List[np.ndarray]) -> List[str]:
+        """Cast members of the movie matched by each favorite actor (first match per favorite)"""
+        cast = [(name, self.actor_vocab.get(_normalize_actor(name))) for name in movie.get("cast", []) or []]
+        out: List[str] = []
+        for aids in matched:
+            aid_set = set(aids.tolist())
+            for name, aid in cast:
+                if aid is not None and aid in aid_set:
+                    out.append(name)
+                    break
+        return out
+
+
+_INDEX_CACHE_SIZE = 4  # JSON catalogs kept indexed at once
+_index_cache: "OrderedDict[str, MovieCatalogIndex]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+def cached_catalog_index(movies: List[Dict[str, Any]]) -> MovieCatalogIndex:
+    """MovieCatalogIndex for movies, reused while the same genres/cast (same order) come back"""
+    h = hashlib.sha1()
+    for movie in movies:
+        h.update(json.dumps([movie.get("genres", []), movie.get("cast", [])], ensure_ascii=False, default=str).encode("utf-8"))
+        h.update(b"\x1f")
+    key = h.hexdigest()
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    index = MovieCatalogIndex(movies)
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def _tfidf_forced() -> bool:
+    force_backend = (os.getenv("RECO_EMBED_BACKEND", "").strip().lower())
+    gigachat_model = (os.getenv("GIGACHAT_EMBED_MODEL", "GigaChat:latest") or "").strip().lower()
+    return force_backend in ("tfidf", "off", "disabled", "none", "0") or gigachat_model in ("off", "disabled", "none", "0")
+
+
 def embed_backend(texts: List[str]) -> np.ndarray:
     """
     Эмбеддинги через GigaChat API, затем фолбэк TF‑IDF.
@@ -126,193 +292,204 @@ def embed_backend(texts: List[str]) -> np.ndarray:
       RECO_EMBED_BACKEND=tfidf  ИЛИ  GIGACHAT_EMBED_MODEL=off|disabled|none|0
     """
     # Принудительно используем TF‑IDF, если так указано в env
-    force_backend = (os.getenv("RECO_EMBED_BACKEND", "").strip().lower())
-    gigachat_model_raw = os.getenv("GIGACHAT_EMBED_MODEL", "GigaChat:latest")
-    gigachat_model = (gigachat_model_raw or "").strip().lower()
-    if force_backend in ("tfidf", "off", "disabled", "none", "0") or gigachat_model in ("off", "disabled", "none", "0"):
+    if _tfidf_forced():
         if os.getenv("RECO_DEBUG"):
             print("EMB_BACKEND=tfidf(force)", file=sys.stderr)
         return _simple_tfidf_embeddings(texts)
 
-    # Эмбеддинги через GigaChat API
-    def _try_gigachat(txs: List[str]):
-        base = os.getenv("GIGACHAT_BASE_URL", "https://ngw.devices.sberbank.ru:9443/api/v2").strip().rstrip("/")
-        api_key = os.getenv("GIGACHAT_API_KEY", "").strip()
-        model = gigachat_model_raw or "GigaChat:latest"
-        timeout_s = float(os.getenv("GIGACHAT_EMBED_TIMEOUT_S", "8"))
-        
-        if not api_key:
+    # 1) GigaChat API, 2) Ollama
+    arr = dense_embed_backend(texts)
+    if arr is not None:
+        return arr
+
+    # 3) Фолбэк TF‑IDF (без внешних API)
+    if os.getenv("RECO_DEBUG"):
+        print("EMB_BACKEND=tfidf", file=sys.stderr)
+    return _simple_tfidf_embeddings(texts)
+
+
+def dense_model_label() -> str:
+    """Backend/model the dense embeddings come from (GigaChat if a key is set, else Ollama)"""
+    if os.getenv("GIGACHAT_API_KEY", "").strip():
+        return f"gigachat:{os.getenv('GIGACHAT_EMBED_MODEL', 'GigaChat:latest')}"
+    return f"ollama:{os.getenv('OLLAMA_EMBED_MODEL', 'bge-m3')}"
+
+
+# Эмбеддинги через GigaChat API
+def _try_gigachat(txs: List[str], model: str, before_request: Optional[Callable[[], None]] = None) -> Optional[np.ndarray]:
+    base = os.getenv("GIGACHAT_BASE_URL", "https://ngw.devices.sberbank.ru:9443/api/v2").strip().rstrip("/")
+    api_key = os.getenv("GIGACHAT_API_KEY", "").strip()
+    model = model or "GigaChat:latest"
+    timeout_s = float(os.getenv("GIGACHAT_EMBED_TIMEOUT_S", "8"))
+
+    if not api_key:
+        return None
+
+    try:
+        # Получаем токен доступа
+        if before_request is not None:
+            before_request()
+        token_response = requests.post(f"{base}/oauth", 
+            headers={
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Accept': 'application/json',
+                'RqUID': str(uuid.uuid4()),
+                'Authorization': f'Basic {api_key}'
+            },
+            data='scope=GIGACHAT_API_PERS',
+            timeout=timeout_s
+        )
+
+        if token_response.status_code >= 400:
             return None
-            
-        try:
-            # Получаем токен доступа
-            token_response = requests.post(f"{base}/oauth", 
+
+        token_data = token_response.json()
+        access_token = token_data.get('access_token')
+
+        if not access_token:
+            return None
+
+        # Получаем эмбеддинги
+        vectors: List[np.ndarray] = []
+        for s in txs:
+            if before_request is not None:
+                before_request()
+            embed_response = requests.post(f"{base}/embeddings",
                 headers={
-                    'Content-Type': 'application/x-www-form-urlencoded',
+                    'Content-Type': 'application/json',
                     'Accept': 'application/json',
-                    'RqUID': str(uuid.uuid4()),
-                    'Authorization': f'Basic {api_key}'
+                    'Authorization': f'Bearer {access_token}'
+                },
+                json={
+                    'model': model,
+                    'input': s
                 },
-                data='scope=GIGACHAT_API_PERS',
                 timeout=timeout_s
             )
-            
-            if token_response.status_code >= 400:
+
+            if embed_response.status_code >= 400:
                 return None
-                
-            token_data = token_response.json()
-            access_token = token_data.get('access_token')
-            
-            if not access_token:
+
+            data = embed_response.json()
+            vec = None
+
+            # Разбор возможных форматов ответа GigaChat
+            if isinstance(data, dict):
+                if "data" in data and isinstance(data["data"], list) and len(data["data"]) > 0:
+                    emb_list = data["data"][0].get("embedding")
+                    if isinstance(emb_list, list) and len(emb_list) > 0 and isinstance(emb_list[0], (float, int)):
+                        vec = np.array(emb_list, dtype=np.float32)
+                elif "embedding" in data and isinstance(data["embedding"], list):
+                    if len(data["embedding"]) > 0 and isinstance(data["embedding"][0], (float, int)):
+                        vec = np.array(data["embedding"], dtype=np.float32)
+
+            if vec is None or vec.size == 0:
+                if os.getenv("RECO_DEBUG"):
+                    print("EMB_GIGACHAT_EMPTY", file=sys.stderr)
                 return None
-            
-            # Получаем эмбеддинги
-            vectors: List[np.ndarray] = []
-            for s in txs:
-                embed_response = requests.post(f"{base}/embeddings",
-                    headers={
-                        'Content-Type': 'application/json',
-                        'Accept': 'application/json',
-                        'Authorization': f'Bearer {access_token}'
-                    },
-                    json={
-                        'model': model,
-                        'input': s
-                    },
-                    timeout=timeout_s
-                )
-                
-                if embed_response.status_code >= 400:
+
+            vectors.append(vec)
+
+        if len(vectors) == len(txs):
+            if os.getenv("RECO_DEBUG"):
+                print(f"EMB_BACKEND=gigachat;MODEL={model}", file=sys.stderr)
+            return np.vstack(vectors)
+
+    except Exception as e:
+        if os.getenv("RECO_DEBUG"):
+            print(f"EMB_GIGACHAT_ERR {str(e)[:200]}", file=sys.stderr)
+        return None
+
+
+# Локальные эмбеддинги через Ollama (используем env или дефолт 127.0.0.1)
+def _try_ollama(txs: List[str], model: str, before_request: Optional[Callable[[], None]] = None) -> Optional[np.ndarray]:
+    base = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434").strip().rstrip("/")
+    timeout_s = float(os.getenv("OLLAMA_EMBED_TIMEOUT_S", "8"))
+    try:
+        vectors: List[np.ndarray] = []
+        for s in txs:
+            payload = {"model": model, "prompt": s}
+            if before_request is not None:
+                before_request()
+            if _HAVE_REQUESTS:
+                r = requests.post(f"{base}/api/embeddings", json=payload, timeout=timeout_s)
+                if r.status_code >= 400:
                     return None
-                    
-                data = embed_response.json()
-                vec = None
-                
-                # Разбор возможных форматов ответа GigaChat
-                if isinstance(data, dict):
-                    if "data" in data and isinstance(data["data"], list) and len(data["data"]) > 0:
-                        emb_list = data["data"][0].get("embedding")
+                data = r.json()
+            else:  # pragma: no cover
+                req = urllib.request.Request(f"{base}/api/embeddings", data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST")  # type: ignore
+                with urllib.request.urlopen(req, timeout=timeout_s) as rr:  # type: ignore
+                    data = json.loads(rr.read().decode("utf-8"))
+            # Разбор возможных форматов ответа Ollama
+            vec = None
+            if isinstance(data, dict):
+                if "embedding" in data and isinstance(data["embedding"], list):
+                    # Один вход → один вектор
+                    if len(data["embedding"]) > 0 and isinstance(data["embedding"][0], (float, int)):
+                        vec = np.array(data["embedding"], dtype=np.float32)
+                elif "embeddings" in data and isinstance(data["embeddings"], list):
+                    # На всякий случай: некоторые билды могут класть вектор сюда
+                    if len(data["embeddings"]) == 1 and isinstance(data["embeddings"][0], list) and len(data["embeddings"][0]) > 0:
+                        vec = np.array(data["embeddings"][0], dtype=np.float32)
+                    elif len(data["embeddings"]) > 0 and isinstance(data["embeddings"][0], (float, int)):
+                        vec = np.array(data["embeddings"][0], dtype=np.float32)
+                elif "data" in data and isinstance(data["data"], list):
+                    # OpenAI‑подобный формат: [{ embedding: [...] }]
+                    items = data["data"]
+                    if len(items) == 1 and isinstance(items[0], dict):
+                        emb_list = items[0].get("embedding")
                         if isinstance(emb_list, list) and len(emb_list) > 0 and isinstance(emb_list[0], (float, int)):
                             vec = np.array(emb_list, dtype=np.float32)
-                    elif "embedding" in data and isinstance(data["embedding"], list):
-                        if len(data["embedding"]) > 0 and isinstance(data["embedding"][0], (float, int)):
-                            vec = np.array(data["embedding"], dtype=np.float32)
-                
-                if vec is None or vec.size == 0:
-                    if os.getenv("RECO_DEBUG"):
-                        print("EMB_GIGACHAT_EMPTY", file=sys.stderr)
-                    return None
-                    
-                vectors.append(vec)
-            
-            if len(vectors) == len(txs):
+            if vec is None or vec.size == 0:
                 if os.getenv("RECO_DEBUG"):
-                    print(f"EMB_BACKEND=gigachat;MODEL={model}", file=sys.stderr)
-                return np.vstack(vectors)
-                
-        except Exception as e:
+                    print("EMB_OLLAMA_EMPTY", file=sys.stderr)
+                return None
+            vectors.append(vec)
+        if len(vectors) == len(txs):
             if os.getenv("RECO_DEBUG"):
-                print(f"EMB_GIGACHAT_ERR {str(e)[:200]}", file=sys.stderr)
-            return None
+                print(f"EMB_BACKEND=ollama;MODEL={model}", file=sys.stderr)
+            return np.vstack(vectors)
+    except Exception as e:
+        if os.getenv("RECO_DEBUG"):
+            print(f"EMB_OLLAMA_ERR {str(e)[:200]}", file=sys.stderr)
+        return None
 
-    # Локальные эмбеддинги через Ollama (используем env или дефолт 127.0.0.1)
-    def _try_ollama(txs: List[str]):
-        base = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434").strip().rstrip("/")
-        model = os.getenv("OLLAMA_EMBED_MODEL", "bge-m3")
-        timeout_s = float(os.getenv("OLLAMA_EMBED_TIMEOUT_S", "8"))
-        try:
-            vectors: List[np.ndarray] = []
-            for s in txs:
-                payload = {"model": model, "prompt": s}
-                if _HAVE_REQUESTS:
-                    r = requests.post(f"{base}/api/embeddings", json=payload, timeout=timeout_s)
-                    if r.status_code >= 400:
-                        return None
-                    data = r.json()
-                else:  # pragma: no cover
-                    req = urllib.request.Request(f"{base}/api/embeddings", data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST")  # type: ignore
-                    with urllib.request.urlopen(req, timeout=timeout_s) as rr:  # type: ignore
-                        data = json.loads(rr.read().decode("utf-8"))
-                # Разбор возможных форматов ответа Ollama
-                vec = None
-                if isinstance(data, dict):
-                    if "embedding" in data and isinstance(data["embedding"], list):
-                        # Один вход → один вектор
-                        if len(data["embedding"]) > 0 and isinstance(data["embedding"][0], (float, int)):
-                            vec = np.array(data["embedding"], dtype=np.float32)
-                    elif "embeddings" in data and isinstance(data["embeddings"], list):
-                        # На всякий случай: некоторые билды могут класть вектор сюда
-                        if len(data["embeddings"]) == 1 and isinstance(data["embeddings"][0], list) and len(data["embeddings"][0]) > 0:
-                            vec = np.array(data["embeddings"][0], dtype=np.float32)
-                        elif len(data["embeddings"]) > 0 and isinstance(data["embeddings"][0], (float, int)):
-                            vec = np.array(data["embeddings"][0], dtype=np.float32)
-                    elif "data" in data and isinstance(data["data"], list):
-                        # OpenAI‑подобный формат: [{ embedding: [...] }]
-                        items = data["data"]
-                        if len(items) == 1 and isinstance(items[0], dict):
-                            emb_list = items[0].get("embedding")
-                            if isinstance(emb_list, list) and len(emb_list) > 0 and isinstance(emb_list[0], (float, int)):
-                                vec = np.array(emb_list, dtype=np.float32)
-                if vec is None or vec.size == 0:
-                    if os.getenv("RECO_DEBUG"):
-                        print("EMB_OLLAMA_EMPTY", file=sys.stderr)
-                    return None
-                vectors.append(vec)
-            if len(vectors) == len(txs):
-                if os.getenv("RECO_DEBUG"):
-                    print(f"EMB_BACKEND=ollama;MODEL={model}", file=sys.stderr)
-                return np.vstack(vectors)
-        except Exception as e:
-            if os.getenv("RECO_DEBUG"):
-                print(f"EMB_OLLAMA_ERR {str(e)[:200]}", file=sys.stderr)
-            return None
 
+def dense_embed_backend(texts: List[str]) -> Optional[np.ndarray]:
+    """
+    Плотные эмбеддинги: GigaChat API, затем Ollama.
+    Без фолбэка на TF‑IDF: None, если ни один бэкенд не ответил.
+    """
     # 1) GigaChat API
-    arr = _try_gigachat(texts)
+    arr = _try_gigachat(texts, os.getenv("GIGACHAT_EMBED_MODEL", "GigaChat:latest"))
     if arr is not None:
         return arr
 
     # 2) Ollama (fallback)
-    arr = _try_ollama(texts)
-    if arr is not None:
-        return arr
+    return _try_ollama(texts, os.getenv("OLLAMA_EMBED_MODEL", "bge-m3"))
 
-    # 3) Фолбэк TF‑IDF (без внешних API)
-    if os.getenv("RECO_DEBUG"):
-        print("EMB_BACKEND=tfidf", file=sys.stderr)
-    return _simple_tfidf_embeddings(texts)
+
+def dense_embed_for(label: str, texts: List[str], before_request: Optional[Callable[[], None]] = None) -> Optional[np.ndarray]:
+    """
+    Embeddings from exactly the backend/model named by a dense_model_label() value.
+    No fallback: vectors must live in the same space as a store built under that label.
+    before_request is called before every HTTP request (rate limiting).
+    """
+    backend, _, model = (label or "").partition(":")
+    if backend == "gigachat":
+        return _try_gigachat(texts, model, before_request)
+    if backend == "ollama":
+        return _try_ollama(texts, model, before_request)
+    return None
 
 
 def _simple_tfidf_embeddings(texts: List[str]) -> np.ndarray:
-    import re
-    from collections import Counter
-
-    tokens_per_doc: List[List[str]] = [re.findall(r"[\w]+", (t or "").lower()) for t in texts]
-    vocab_counter: Counter[str] = Counter()
-    for toks in tokens_per_doc:
-        for token in set(toks):
-            vocab_counter[token] += 1
-    vocab = {tok: idx for idx, (tok, _) in enumerate(vocab_counter.items())}
-    n_docs = max(1, len(texts))
-    idf = np.zeros((len(vocab),), dtype=np.float32)
-    for tok, df in vocab_counter.items():
-        idf[vocab[tok]] = float(np.log((n_docs + 1) / (df + 1)) + 1.0)
-    X = np.zeros((len(texts), len(vocab)), dtype=np.float32)
-    for i, toks in enumerate(tokens_per_doc):
-        counts = Counter(toks)
-        if not counts:
-            continue
-        max_tf = max(counts.values())
-        for tok, tf in counts.items():
-            j = vocab.get(tok)
-            if j is None:
-                continue
-            tf_norm = 0.5 + 0.5 * (tf / max_tf)
-            X[i, j] = tf_norm * idf[j]
-    # L2 normalize rows
-    norms = np.linalg.norm(X, axis=1, keepdims=True)
-    norms[norms == 0] = 1.0
-    return (X / norms).astype(np.float32)
+    # Fitted corpus projection (RECO_TFIDF_REDUCER_MOVIES): fixed-width dense rows instead of vocabulary-wide ones
+    reducer = active_reducer("movies")
+    if reducer is not None:
+        return reducer.transform(texts)
+    # Token IDs come from the shared cache, so repeated texts are not re-tokenized
+    return tfidf_embeddings(texts)
 
 
 def _cosine(a: np.ndarray, b: np.ndarray) -> float:
@@ -325,17 +502,91 @@ def _cosine(a: np.ndarray, b: np.ndarray) -> float:
     return float(max(0.0, min(1.0, sim)))
 
 
-def calculate_movie_similarity(user: Dict[str, Any], movie: Dict[str, Any], embed_func: Callable[[List[str]], np.ndarray]) -> Tuple[float, Dict[str, float]]:
+def _user_preferences_text(user: Dict[str, Any]) -> str:
+    return f"{user.get('preferred_genres', [])} {user.get('preferred_themes', [])}"
+
+
+def _movie_plot_text(movie: Dict[str, Any]) -> str:
+    return f"{movie.get('title', '')} {movie.get('plot', '')} {movie.get('genres', [])}"
+
+
+def _catalog_plot_sims(user: Dict[str, Any], movies: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """
+    Plot similarity from precomputed catalog embeddings (scripts/embed_catalog.py,
+    store dir in RECO_MOVIE_EMBEDDINGS): only the user text is embedded online.
+    NaN marks movies missing from the store or with changed text.
+    """
+    if _tfidf_forced():
+        return None
+    store = EmbeddingStore.open(os.getenv("RECO_MOVIE_EMBEDDINGS"))
+    if store is None or not store.ids or store.model != dense_model_label():
+        return None
+    # Same backend as the store, never a fallback: another model's vectors are not comparable
+    user_vec = dense_embed_for(store.model, [_user_preferences_text(user)])
+    if user_vec is None or user_vec.shape[1] != store.dim:
+        return None
+    rows = np.array([store.row_of(str(m.get("id")), text_hash(_movie_plot_text(m))) for m in movies], dtype=np.int64)
+    sims = np.full((len(movies),), np.nan)
+    found = rows >= 0
+    if found.any():
+        try:
+            mat = np.asarray(store.vectors[rows[found]], dtype=np.float64)
+        except (OSError, ValueError):
+            # Store is being reset or rebuilt under us: score without precomputed plots
+            return None
+        u = user_vec[0].astype(np.float64)
+        denom = np.linalg.norm(mat, axis=1) * np.linalg.norm(u)
+        dots = mat @ u
+        sims[found] = np.clip(np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0), 0.0, 1.0)
+    if os.getenv("RECO_DEBUG"):
+        print(f"PLOT_EMB=precomputed;HIT={int(found.sum())}/{len(movies)}", file=sys.stderr)
+    return sims
+
+
+def _plot_sim_at(plot_sims: Optional[np.ndarray], i: int) -> Optional[float]:
+    if plot_sims is None or np.isnan(plot_sims[i]):
+        return None
+    return float(plot_sims[i])
+
+
+# Weights
+_WEIGHTS: Dict[str, float] = {
+    "genre": 0.40,
+    "plot": 0.30,
+    "rating": 0.15,
+    "year": 0.10,
+    "cast": 0.05,
+}
+
+# Weight name → per-factor key in calculate_movie_similarity details
+_WEIGHT_FACTORS: Dict[str, str] = {
+    "genre": "genre_sim",
+    "plot": "plot_sim",
+    "rating": "rating_sim",
+    "year": "year_sim",
+    "cast": "cast_sim",
+}
+
+
+def calculate_movie_similarity(
+    user: Dict[str, Any],
+    movie: Dict[str, Any],
+    embed_func: Callable[[List[str]], np.ndarray],
+    genre_sim: Optional[float] = None,
+    cast_sim: Optional[float] = None,
+    plot_sim: Optional[float] = None,
+) -> Tuple[float, Dict[str, float]]:
     """
     Compute weighted score and per-factor details for movie recommendation.
     Factors and weights:
       genre (0.4), plot (0.3), rating (0.15), year (0.1), cast (0.05)
+    genre_sim/cast_sim can be passed precomputed (see MovieCatalogIndex),
+    plot_sim from the precomputed catalog embeddings (see _catalog_plot_sims).
     """
     
     # Genre similarity
-    user_genres = user.get("preferred_genres", [])
-    movie_genres = movie.get("genres", [])
-    genre_sim = _calculate_genre_similarity(user_genres, movie_genres)
+    if genre_sim is None:
+        genre_sim = _calculate_genre_similarity(user.get("preferred_genres", []), movie.get("genres", []))
     
     # Rating similarity
     user_rating_pref = user.get("preferred_rating", 0)
@@ -348,34 +599,23 @@ def calculate_movie_similarity(user: Dict[str, Any], movie: Dict[str, Any], embe
     year_sim = _calculate_year_similarity(user_year_pref, movie_year)
     
     # Plot similarity (semantic)
-    user_preferences_text = f"{user.get('preferred_genres', [])} {user.get('preferred_themes', [])}"
-    movie_plot_text = f"{movie.get('title', '')} {movie.get('plot', '')} {movie.get('genres', [])}"
-    
-    try:
-        embeds = embed_func([user_preferences_text, movie_plot_text])
-        plot_sim = _cosine(embeds[0], embeds[1])
-    except Exception:
-        plot_sim = 0.5  # Neutral score if embedding fails
-    
-    # Cast similarity (simple keyword matching)
-    user_favorite_actors = user.get("favorite_actors", [])
-    movie_cast = movie.get("cast", [])
-    cast_sim = 0.0
-    if user_favorite_actors and movie_cast:
-        user_actors_lower = [actor.lower() for actor in user_favorite_actors]
-        movie_cast_lower = [actor.lower() for actor in movie_cast]
-        matches = sum(1 for actor in user_actors_lower if any(actor in cast_member for cast_member in movie_cast_lower))
-        cast_sim = min(1.0, matches / len(user_favorite_actors))
-    
-    # Weights
-    weights = {
-        "genre": 0.40,
-        "plot": 0.30,
-        "rating": 0.15,
-        "year": 0.10,
-        "cast": 0.05,
-    }
-    
+    if plot_sim is None:
+        try:
+            embeds = embed_func([_user_preferences_text(user), _movie_plot_text(movie)])
+            plot_sim = _cosine(embeds[0], embeds[1])
+        except Exception:
+            plot_sim = 0.5  # Neutral score if embedding fails
+    
+    # Cast similarity (token-prefix name matching)
+    if cast_sim is None:
+        user_favorite_actors = user.get("favorite_actors", [])
+        movie_cast = movie.get("cast", [])
+        cast_sim = 0.0
+        if user_favorite_actors and movie_cast:
+            matches = sum(1 for actor in user_favorite_actors if any(_actor_matches(actor, cast_member) for cast_member in movie_cast))
+            cast_sim = min(1.0, matches / len(user_favorite_actors))
+    
+    weights = _WEIGHTS
     score = (
         genre_sim * weights["genre"]
         + plot_sim * weights["plot"]
@@ -396,7 +636,12 @@ def calculate_movie_similarity(user: Dict[str, Any], movie: Dict[str, Any], embe
     return float(score), details
 
 
-def generate_movie_explanation(user: Dict[str, Any], movie: Dict[str, Any], details: Dict[str, float]) -> str:
+def generate_movie_explanation(
+    user: Dict[str, Any],
+    movie: Dict[str, Any],
+    details: Dict[str, float],
+    matched_cast: Optional[List[str]] = None,
+) -> str:
     """Generate explanation for movie recommendation"""
     
     movie_title = movie.get("title", "Неизвестный фильм")
@@ -427,17 +672,19 @@ def generate_movie_explanation(user: Dict[str, Any], movie: Dict[str, Any], deta
     
     # Cast explanation
     cast_text = ""
-    user_actors = user.get("favorite_actors", [])
-    movie_cast = movie.get("cast", [])
-    if user_actors and movie_cast:
+    matching_actors = matched_cast
+    if matching_actors is None:
         matching_actors = []
-        for actor in user_actors:
-            for cast_member in movie_cast:
-                if actor.lower() in cast_member.lower():
-                    matching_actors.append(cast_member)
-                    break
-        if matching_actors:
-            cast_text = f"В ролях: {', '.join(matching_actors[:2])}."
+        user_actors = user.get("favorite_actors", [])
+        movie_cast = movie.get("cast", [])
+        if user_actors and movie_cast:
+            for actor in user_actors:
+                for cast_member in movie_cast:
+                    if _actor_matches(actor, cast_member):
+                        matching_actors.append(cast_member)
+                        break
+    if matching_actors:
+        cast_text = f"В ролях: {', '.join(matching_actors[:2])}."
     
     # Combine explanations
     parts = [f"Фильм: {movie_title}."]
@@ -461,14 +708,149 @@ def generate_movie_explanation(user: Dict[str, Any], movie: Dict[str, Any], deta
     return " ".join(parts)
 
 
-def recommend_movies(user_json: Dict[str, Any], movies_json: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Main recommendation function"""
+_DETAIL_KEYS: Tuple[str, ...] = (
+    "score",
+    "genre_sim",
+    "plot_sim",
+    "rating_sim",
+    "year_sim",
+    "cast_sim",
+)
+
+
+def _page_details(user_json: Dict[str, Any], movies: List[Dict[str, Any]]) -> List[Dict[str, float]]:
+    """Factor details for just the movies of one page (the ranking stores scores only)"""
+    embed = embed_backend
+    plot_sims = _catalog_plot_sims(user_json, movies)
+    return [calculate_movie_similarity(user_json, movie, embed, plot_sim=_plot_sim_at(plot_sims, i))[1] for i, movie in enumerate(movies)]
+
+
+def _movies_page(
+    user_json: Dict[str, Any],
+    movies_json: List[Dict[str, Any]],
+    page: Page,
+    columns: Optional[np.ndarray] = None,
+    index: Optional[MovieCatalogIndex] = None,
+    matched_actors: Optional[List[np.ndarray]] = None,
+) -> Dict[str, Any]:
+    """
+    Build result items (with explanations) for one page of a cached ranking.
+    columns: catalog-wide factors when the ranking was just built; otherwise
+    the factors are recomputed for the page rows only.
+    """
+    movies = [movies_json[pos] for pos in page.rows.tolist()]
+    if columns is not None:
+        page_details = [dict(zip(_DETAIL_KEYS, columns[pos].tolist())) for pos in page.rows.tolist()]
+    else:
+        page_details = _page_details(user_json, movies)
+    items: List[Dict[str, Any]] = []
+    for movie, score, details in zip(movies, page.scores.tolist(), page_details):
+        matched_cast = index.matching_cast(movie, matched_actors) if index is not None and matched_actors is not None else None
+        items.append({
+            "movie_id": movie.get("id"),
+            "title": movie.get("title"),
+            "score": round(score, 4),
+            "explanation": generate_movie_explanation(user_json, movie, details, matched_cast),
+            "details": details,
+        })
+    return {"items": items, "next_cursor": page.next_cursor, "total": page.total, "reset": page.reset}
+
+
+def _top_k_movies(
+    user_json: Dict[str, Any],
+    movies_json: List[Dict[str, Any]],
+    index: Optional[MovieCatalogIndex],
+    top_k: int,
+    scorer: ChunkedScorer,
+) -> List[Dict[str, Any]]:
+    """Chunked, memory-capped scoring (RECO_MAX_MEM_MB): only the top_k movies are kept"""
+    embed = embed_backend
+    if index is None:
+        index = cached_catalog_index(movies_json)
+    genre_sims = index.genre_similarity(user_json.get("preferred_genres", []))
+    cast_sims, matched_actors = index.cast_similarity(user_json.get("favorite_actors", []))
+    plot_sims = _catalog_plot_sims(user_json, movies_json)
+    scorer.reserve(genre_sims, cast_sims, plot_sims)
+
+    def fill(start: int, stop: int, out: np.ndarray) -> None:
+        for j, i in enumerate(range(start, stop)):
+            _, details = calculate_movie_similarity(user_json, movies_json[i], embed, float(genre_sims[i]), float(cast_sims[i]), _plot_sim_at(plot_sims, i))
+            out[j] = [details[k] for k in _DETAIL_KEYS]
+
+    best = scorer.top_k(fill, top_k, _DETAIL_KEYS.index("score"))
+    if os.getenv("RECO_DEBUG"):
+        print(f"CHUNKED {json.dumps(scorer.stats())}", file=sys.stderr)
+    top: List[Dict[str, Any]] = []
+    for pos, score, row in best:
+        movie = movies_json[pos]
+        details = dict(zip(_DETAIL_KEYS, row.tolist()))
+        top.append({
+            "movie_id": movie.get("id"),
+            "title": movie.get("title"),
+            "score": score,
+            "explanation": generate_movie_explanation(user_json, movie, details, index.matching_cast(movie, matched_actors)),
+            "details": details,
+        })
+    return top
+
+
+def recommend_movies(
+    user_json: Dict[str, Any],
+    movies_json: List[Dict[str, Any]],
+    page_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    index: Optional[MovieCatalogIndex] = None,
+    top_k: Optional[int] = None,
+) -> Any:
+    """
+    Main recommendation function.
+    With page_size/cursor returns {"items", "next_cursor", "total", "reset"} and keeps
+    the ranking server-side, so following pages are slices of the cached ranking.
+    A rejected (expired, stale or foreign) cursor rebuilds page 1 with reset=True.
+    index: prebuilt MovieCatalogIndex for movies_json (cached per catalog otherwise).
+    top_k: without paging, score the catalog in chunks within RECO_MAX_MEM_MB
+    and return only the top_k movies.
+    """
+    paged = page_size is not None or cursor is not None
+    if paged:
+        catalog = catalog_fingerprint(m.get("id") for m in movies_json)
+        profile = profile_fingerprint("movies", user_json)
+    if cursor:
+        page = _RANKINGS.page(cursor, len(movies_json), page_size, catalog, profile)
+        if page is not None:
+            return _movies_page(user_json, movies_json, page)
+        # Invalid/expired cursor, other user or changed catalog: rebuild the ranking and flag the reset
+
     embed = embed_backend  # choose embedding backend
+
+    if not paged and top_k is not None and top_k > 0:
+        scorer = ChunkedScorer(len(movies_json), len(_DETAIL_KEYS))
+        # Catalog-wide preparation counts against the same memory budget as the chunks
+        with scorer.tracking():
+            return _top_k_movies(user_json, movies_json, index, top_k, scorer)
+
+    # Genre and cast factors for the whole catalog in one vectorized pass
+    if index is None:
+        index = cached_catalog_index(movies_json)
+    genre_sims = index.genre_similarity(user_json.get("preferred_genres", []))
+    cast_sims, matched_actors = index.cast_similarity(user_json.get("favorite_actors", []))
+    plot_sims = _catalog_plot_sims(user_json, movies_json)
+
+    if paged:
+        columns = np.zeros((len(movies_json), len(_DETAIL_KEYS)), dtype=np.float64)
+        for i, movie in enumerate(movies_json):
+            _, details = calculate_movie_similarity(user_json, movie, embed, float(genre_sims[i]), float(cast_sims[i]), _plot_sim_at(plot_sims, i))
+            columns[i] = [details[k] for k in _DETAIL_KEYS]
+        page = _RANKINGS.first_page(
+            columns[:, _DETAIL_KEYS.index("score")], page_size or DEFAULT_PAGE_SIZE, catalog=catalog, profile=profile, reset=bool(cursor)
+        )
+        return _movies_page(user_json, movies_json, page, columns, index, matched_actors)
+
     
     results: List[Dict[str, Any]] = []
-    for movie in movies_json:
-        score, details = calculate_movie_similarity(user_json, movie, embed)
-        explanation = generate_movie_explanation(user_json, movie, details)
+    for i, movie in enumerate(movies_json):
+        score, details = calculate_movie_similarity(user_json, movie, embed, float(genre_sims[i]), float(cast_sims[i]), _plot_sim_at(plot_sims, i))
+        explanation = generate_movie_explanation(user_json, movie, details, index.matching_cast(movie, matched_actors))
         results.append({
             "movie_id": movie.get("id"),
             "title": movie.get("title"),
@@ -482,6 +864,50 @@ def recommend_movies(user_json: Dict[str, Any], movies_json: List[Dict[str, Any]
     return results
 
 
+def recommend_movies_variants(
+    user_json: Dict[str, Any],
+    movies_json: List[Dict[str, Any]],
+    variants: Dict[str, Dict[str, float]],
+    top_k: Optional[int] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Rankings for several weight sets in one pass (A/B arms, offline sweeps).
+    Factors are computed once; variants are partial overrides of _WEIGHTS.
+    """
+    embed = embed_backend  # choose embedding backend
+
+    index = cached_catalog_index(movies_json)
+    genre_sims = index.genre_similarity(user_json.get("preferred_genres", []))
+    cast_sims, matched_actors = index.cast_similarity(user_json.get("favorite_actors", []))
+    plot_sims = _catalog_plot_sims(user_json, movies_json)
+
+    names = list(_WEIGHT_FACTORS)
+    factors = np.zeros((len(movies_json), len(names)), dtype=np.float64)
+    all_details: List[Dict[str, float]] = []
+    for i, movie in enumerate(movies_json):
+        _, details = calculate_movie_similarity(user_json, movie, embed, float(genre_sims[i]), float(cast_sims[i]), _plot_sim_at(plot_sims, i))
+        factors[i] = [details[_WEIGHT_FACTORS[n]] for n in names]
+        all_details.append(details)
+
+    explanations: Dict[int, str] = {}
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for arm, (order, scores) in rank_variants(factors, names, variants, _WEIGHTS, top_k).items():
+        items: List[Dict[str, Any]] = []
+        for pos, score in zip(order.tolist(), scores.tolist()):
+            movie = movies_json[pos]
+            if pos not in explanations:
+                explanations[pos] = generate_movie_explanation(user_json, movie, all_details[pos], index.matching_cast(movie, matched_actors))
+            items.append({
+                "movie_id": movie.get("id"),
+                "title": movie.get("title"),
+                "score": round(float(score), 4),
+                "explanation": explanations[pos],
+                "details": {**all_details[pos], "score": float(score)},
+            })
+        out[arm] = items
+    return out
+
+
 if __name__ == "__main__":
     payload = os.getenv("RECO_PAYLOAD")
     if payload:
@@ -489,7 +915,10 @@ if __name__ == "__main__":
             data = json.loads(payload)
             user = data.get("user", {})
             movies = data.get("movies", [])
-            out = recommend_movies(user, movies)
+            if data.get("variants"):
+                out = recommend_movies_variants(user, movies, data["variants"], top_k=data.get("top_k"))
+            else:
+                out = recommend_movies(user, movies, page_size=data.get("page_size"), cursor=data.get("cursor"), top_k=data.get("top_k"))
             # Print compact JSON for the Node caller
             print(json.dumps(out, ensure_ascii=False))
         except Exception as e:
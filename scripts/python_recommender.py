@@ -2,8 +2,8 @@
 Job recommendation service (Python)
 
 Основные принципы:
-- Локальные эмбеддинги через TF-IDF (стабильно)
-- Косинусная близость по навыкам/описаниям/опыту
+- Локальные эмбеддинги через TF-IDF (стабильно); опционально сжатые до фиксированной ширины (RECO_TFIDF_REDUCER_JOBS)
+- Косинусная близость по навыкам/описаниям/опыту (описания — опционально BM25, RECO_DESC_BACKEND=bm25)
 - Весовая формула: 0.55*skills + 0.2*experience + 0.1*level + 0.1*location + 0.05*salary
 - Объяснения простые, на русском
 
@@ -17,11 +17,22 @@ import os
 import json
 import time
 import uuid
-from typing import Callable, Dict, List, Tuple, Any
+from typing import Callable, Dict, List, Tuple, Any, Optional
 import sys
 
 import numpy as np
 
+from reco_bm25 import cached_index, desc_backend
+from reco_chunked import ChunkedScorer
+from reco_cursor import DEFAULT_PAGE_SIZE, Page, RankingStore, catalog_fingerprint, profile_fingerprint
+from reco_dedup import cached_clusters, collapse_order, dedup_enabled, dedup_threshold
+from reco_reduce import active_reducer
+from reco_tokenize import tfidf_embeddings
+from reco_snapshot import VacancySnapshot, load_candidate_sqlite, load_snapshot
+from reco_variants import rank_variants
+
+_RANKINGS = RankingStore()
+
 
 def _lower_set(items: List[str]) -> List[str]:
     return [str(x).strip().lower() for x in (items or []) if str(x).strip()]
@@ -48,35 +59,12 @@ def embed_backend(texts: List[str]) -> np.ndarray:
 
 
 def _simple_tfidf_embeddings(texts: List[str]) -> np.ndarray:
-    import re
-    from collections import Counter
-
-    tokens_per_doc: List[List[str]] = [re.findall(r"[\w]+", (t or "").lower()) for t in texts]
-    vocab_counter: Counter[str] = Counter()
-    for toks in tokens_per_doc:
-        for token in set(toks):
-            vocab_counter[token] += 1
-    vocab = {tok: idx for idx, (tok, _) in enumerate(vocab_counter.items())}
-    n_docs = max(1, len(texts))
-    idf = np.zeros((len(vocab),), dtype=np.float32)
-    for tok, df in vocab_counter.items():
-        idf[vocab[tok]] = float(np.log((n_docs + 1) / (df + 1)) + 1.0)
-    X = np.zeros((len(texts), len(vocab)), dtype=np.float32)
-    for i, toks in enumerate(tokens_per_doc):
-        counts = Counter(toks)
-        if not counts:
-            continue
-        max_tf = max(counts.values())
-        for tok, tf in counts.items():
-            j = vocab.get(tok)
-            if j is None:
-                continue
-            tf_norm = 0.5 + 0.5 * (tf / max_tf)
-            X[i, j] = tf_norm * idf[j]
-    # L2 normalize rows
-    norms = np.linalg.norm(X, axis=1, keepdims=True)
-    norms[norms == 0] = 1.0
-    return (X / norms).astype(np.float32)
+    # Fitted corpus projection (RECO_TFIDF_REDUCER_JOBS): fixed-width dense rows instead of vocabulary-wide ones
+    reducer = active_reducer("jobs")
+    if reducer is not None:
+        return reducer.transform(texts)
+    # Token IDs come from the shared cache, so repeated texts are not re-tokenized
+    return tfidf_embeddings(texts)
 
 
 def _cosine(a: np.ndarray, b: np.ndarray) -> float:
@@ -225,52 +213,148 @@ def _overlap_ratio(user_skills: List[str], job_skills: List[str]) -> float:
     return float(len(inter) / denom)
 
 
-def calculate_similarity(user: Dict[str, Any], vacancy: Dict[str, Any], embed_func: Callable[[List[str]], np.ndarray]) -> Tuple[float, Dict[str, float]]:
+# Weights (increase skills and freshness influence)
+_WEIGHTS: Dict[str, float] = {
+    "skills": 0.60,
+    "experience": 0.15,
+    "level": 0.07,
+    "location": 0.06,
+    "salary": 0.02,
+    "freshness": 0.10,
+}
+
+# Weight name → per-factor key in calculate_similarity details
+_WEIGHT_FACTORS: Dict[str, str] = {
+    "skills": "skills_sim",
+    "experience": "exp_sim",
+    "level": "level_sim",
+    "location": "location_sim",
+    "salary": "salary_sim",
+    "freshness": "freshness_sim",
+}
+
+
+def _dedup_labels(vacancies: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """Near-duplicate clusters of the catalog (MinHash + LSH, cached per catalog); None when collapsing is off"""
+    if not dedup_enabled():
+        return None
+    return cached_clusters([_job_desc_text(v) for v in vacancies], dedup_threshold())
+
+
+def _user_desc_text(user: Dict[str, Any]) -> str:
+    return f"{user.get('position','')} | {_join_skills(user.get('skills', []))} | {_experience_to_text(user.get('experience', {}))}"
+
+
+def _job_desc_text(vacancy: Dict[str, Any]) -> str:
+    return f"{vacancy.get('title','')} | {vacancy.get('description','')} | {_join_skills(vacancy.get('skills', []))}"
+
+
+def _bm25_desc_sims(user: Dict[str, Any], vacancies: List[Dict[str, Any]]) -> np.ndarray:
     """
-    Compute weighted score and per-factor details.
-    Factors and weights:
-      skills (0.5), experience (0.2), level (0.1), location (0.1), salary (0.1)
+    Description similarity for the whole catalog via BM25 postings of the user's terms.
+    The index is cached by catalog texts, so only the first request per catalog builds it.
     """
+    index = cached_index([_job_desc_text(v) for v in vacancies])
+    if os.getenv("RECO_DEBUG"):
+        print(f"DESC_BACKEND=bm25;TERMS={len(index.vocab)}", file=sys.stderr)
+    return index.similarity(_user_desc_text(user))
+
+
+def _text_sims(
+    user: Dict[str, Any],
+    job_skills: List[str],
+    job_desc_text: str,
+    embed_func: Callable[[List[str]], np.ndarray],
+    desc_sim: Optional[float] = None,
+) -> Tuple[float, float]:
+    """Semantic skills similarity and experience similarity from embedded texts"""
     # Prepare texts to embed
     user_skills_text = _join_skills(user.get("skills", []))
-    job_skills_text = _join_skills(vacancy.get("skills", []))
+    job_skills_text = _join_skills(job_skills)
 
     user_exp_text = _experience_to_text(user.get("experience", {}))
-    job_exp_text = _experience_to_text({s: 1 for s in vacancy.get("skills", [])})  # proxy: skills as presence
+    job_exp_text = _experience_to_text({s: 1 for s in job_skills})  # proxy: skills as presence
 
-    user_desc_text = f"{user.get('position','')} | {user_skills_text} | {user_exp_text}"
-    job_desc_text = f"{vacancy.get('title','')} | {vacancy.get('description','')} | {job_skills_text}"
+    if desc_sim is None:
+        embeds = embed_func([user_skills_text, job_skills_text, user_exp_text, job_exp_text, _user_desc_text(user), job_desc_text])
+        u_sk, j_sk, u_exp, j_exp, u_desc, j_desc = embeds
+        desc_sim = _cosine(u_desc, j_desc)
+    else:
+        u_sk, j_sk, u_exp, j_exp = embed_func([user_skills_text, job_skills_text, user_exp_text, job_exp_text])
 
-    embeds = embed_func([user_skills_text, job_skills_text, user_exp_text, job_exp_text, user_desc_text, job_desc_text])
-    u_sk, j_sk, u_exp, j_exp, u_desc, j_desc = embeds
+    semantic_sk = _cosine(u_sk, j_sk) * 0.6 + desc_sim * 0.4
+    # Experience similarity (semantic via textual representation)
+    exp_sim = _cosine(u_exp, j_exp)
+    return semantic_sk, exp_sim
 
+
+def _location_sim(loc_u: str, loc_j: str) -> float:
+    """Location (remote/office/city match, partial contains → 0.5); inputs are lowercased"""
+    if not loc_u or not loc_j:
+        return 0.0
+    if loc_u == "remote" and loc_j == "remote":
+        return 1.0
+    if loc_u == loc_j:
+        return 1.0
+    if loc_u in loc_j or loc_j in loc_u:
+        return 0.5
+    return 0.0
+
+
+# Freshness by posting age: (max days, similarity); older or unknown → _FRESHNESS_STALE
+_FRESHNESS_BUCKETS: Tuple[Tuple[float, float], ...] = ((3.0, 1.0), (7.0, 0.8), (30.0, 0.6))
+_FRESHNESS_STALE = 0.3
+_FRESHNESS_EDGES_S = np.array([d * 86400.0 for d, _ in _FRESHNESS_BUCKETS], dtype=np.float64)
+_FRESHNESS_TABLE = np.array([sim for _, sim in _FRESHNESS_BUCKETS] + [_FRESHNESS_STALE], dtype=np.float64)
+
+
+def _freshness_sims(posted_ts: np.ndarray, now: float) -> np.ndarray:
+    """Vectorized freshness: bucket lookup of posting age against the 3/7/30-day edges"""
+    posted_ts = np.asarray(posted_ts, dtype=np.float64)
+    age = np.maximum(0.0, now - posted_ts)
+    sims = _FRESHNESS_TABLE[np.searchsorted(_FRESHNESS_EDGES_S, age, side="left")]
+    sims[posted_ts <= 0] = _FRESHNESS_STALE
+    return sims
+
+
+def _freshness_expiry(posted_ts: np.ndarray, now: float) -> np.ndarray:
+    """Epoch second after which each vacancy drops to the next freshness bucket (inf if never)"""
+    posted_ts = np.asarray(posted_ts, dtype=np.float64)
+    age = np.maximum(0.0, now - posted_ts)
+    bucket = np.searchsorted(_FRESHNESS_EDGES_S, age, side="left")
+    edges = np.r_[_FRESHNESS_EDGES_S, np.inf]
+    expiry = posted_ts + edges[bucket]
+    expiry[posted_ts <= 0] = np.inf
+    return expiry
+
+
+def calculate_similarity(
+    user: Dict[str, Any],
+    vacancy: Dict[str, Any],
+    embed_func: Callable[[List[str]], np.ndarray],
+    desc_sim: Optional[float] = None,
+) -> Tuple[float, Dict[str, float]]:
+    """
+    Compute weighted score and per-factor details.
+    Factors and weights:
+      skills (0.5), experience (0.2), level (0.1), location (0.1), salary (0.1)
+    desc_sim: precomputed description similarity (e.g. BM25); otherwise TF-IDF cosine.
+    """
     # Skills similarity: semantic + discrete overlap boost
-    semantic_sk = _cosine(u_sk, j_sk) * 0.6 + _cosine(u_desc, j_desc) * 0.4
+    semantic_sk, exp_sim = _text_sims(user, vacancy.get("skills", []), _job_desc_text(vacancy), embed_func, desc_sim)
     overlap_sk = _overlap_ratio(user.get("skills", []), vacancy.get("skills", []))
     skills_sim = 0.7 * semantic_sk + 0.3 * overlap_sk
 
-    # Experience similarity (semantic via textual representation)
-    exp_sim = _cosine(u_exp, j_exp)
-
     # Level
     level_u = str(user.get("level", "")).strip().lower()
     level_j = str(vacancy.get("level", "")).strip().lower()
     level_sim = 1.0 if level_u and level_u == level_j else 0.0
 
-    # Location (remote/office/city match, partial contains → 0.5)
-    loc_u = str(user.get("location", "")).strip().lower()
-    loc_j = str(vacancy.get("location", "")).strip().lower()
-    if not loc_u or not loc_j:
-        location_sim = 0.0
-    elif loc_u == "remote" and loc_j == "remote":
-        location_sim = 1.0
-    else:
-        if loc_u == loc_j:
-            location_sim = 1.0
-        elif loc_u in loc_j or loc_j in loc_u:
-            location_sim = 0.5
-        else:
-            location_sim = 0.0
+    # Location
+    location_sim = _location_sim(
+        str(user.get("location", "")).strip().lower(),
+        str(vacancy.get("location", "")).strip().lower(),
+    )
 
     # Salary: if job >= expected -> 1; else ratio (min 0.2 if not указано)
     sal_expected = float(user.get("salary_expectation") or 0)
@@ -280,32 +364,19 @@ def calculate_similarity(user: Dict[str, Any], vacancy: Dict[str, Any], embed_fu
         salary_sim = min(1.0, sal_job / sal_expected)
 
     # Freshness similarity based on posting time (in seconds since epoch)
-    freshness_sim = 0.3
+    freshness_sim = _FRESHNESS_STALE
     try:
         posted_ts = float(vacancy.get("posted_ts") or 0)
         if posted_ts > 0:
             days = max(0.0, (time.time() - posted_ts) / 86400.0)
-            if days <= 3:
-                freshness_sim = 1.0
-            elif days <= 7:
-                freshness_sim = 0.8
-            elif days <= 30:
-                freshness_sim = 0.6
-            else:
-                freshness_sim = 0.3
+            for max_days, sim in _FRESHNESS_BUCKETS:
+                if days <= max_days:
+                    freshness_sim = sim
+                    break
     except Exception:
-        freshness_sim = 0.3
-
-    # Weights (increase skills and freshness influence)
-    weights = {
-        "skills": 0.60,
-        "experience": 0.15,
-        "level": 0.07,
-        "location": 0.06,
-        "salary": 0.02,
-        "freshness": 0.10,
-    }
+        freshness_sim = _FRESHNESS_STALE
 
+    weights = _WEIGHTS
     score = (
         skills_sim * weights["skills"]
         + exp_sim * weights["experience"]
@@ -327,6 +398,95 @@ def calculate_similarity(user: Dict[str, Any], vacancy: Dict[str, Any], embed_fu
     return float(score), details
 
 
+def _snapshot_factors(
+    user: Dict[str, Any],
+    snap: VacancySnapshot,
+    embed_func: Callable[[List[str]], np.ndarray],
+    reserve: Optional[Callable[..., None]] = None,
+) -> Callable[[int, int, np.ndarray], None]:
+    """
+    Same factors as calculate_similarity, computed over a columnar snapshot.
+    Per-user lookup tables are prepared once; the returned fill(start, stop, out)
+    writes the _DETAIL_KEYS columns of rows [start, stop) into `out`.
+    reserve: receives the catalog-wide arrays that fill() keeps (ChunkedScorer.reserve).
+    Structured factors are vectorized over codes/arrays; only the text
+    similarities are still evaluated per vacancy.
+    """
+    col = {k: i for i, k in enumerate(_DETAIL_KEYS)}
+
+    # Skill overlap: normalize each dictionary entry once, dedupe per vacancy
+    user_skills = set(_normalize_skills_list(user.get("skills", [])))
+    norm_vocab: Dict[str, int] = {}
+    norm_code = np.array(
+        [norm_vocab.setdefault((_normalize_skills_list([name]) or [""])[0], len(norm_vocab)) for name in snap.skill_dict.tolist()],
+        dtype=np.int64,
+    ).reshape(-1)
+    n_norm = max(1, len(norm_vocab))
+    user_codes = np.array([norm_vocab[s] for s in user_skills if s in norm_vocab], dtype=np.int64)
+
+    desc_sims = None
+    if desc_backend() == "bm25":
+        # Postings are built once per snapshot; a request only walks its own terms
+        desc_sims = snap.bm25().similarity(_user_desc_text(user))
+
+    # Level and location: evaluate once per dictionary entry, gather by code
+    level_u = str(user.get("level", "")).strip().lower()
+    level_table = np.array([1.0 if level_u and level_u == lv else 0.0 for lv in snap.level_dict.tolist()])
+    loc_u = str(user.get("location", "")).strip().lower()
+    loc_table = np.array([_location_sim(loc_u, loc) for loc in snap.location_dict.tolist()])
+    sal_expected = float(user.get("salary_expectation") or 0)
+    now = time.time()
+    if reserve is not None:
+        reserve(norm_code, user_codes, desc_sims, level_table, loc_table)
+
+    def fill(start: int, stop: int, cols: np.ndarray) -> None:
+        m = stop - start
+        offsets = snap.skill_offsets[start:stop + 1]
+        rows = np.repeat(np.arange(m, dtype=np.int64), np.diff(offsets))
+        pairs = np.unique(rows * n_norm + norm_code[snap.skill_codes[offsets[0]:offsets[-1]]])
+        pair_rows = pairs // n_norm
+        hits = np.isin(pairs % n_norm, user_codes)
+        job_counts = np.bincount(pair_rows, minlength=m)
+        inter = np.bincount(pair_rows, weights=hits, minlength=m)
+        denom = np.maximum(job_counts, len(user_skills))
+        overlap = np.zeros((m,), dtype=np.float64)
+        if user_skills:
+            np.divide(inter, denom, out=overlap, where=(job_counts > 0) & (denom > 0))
+
+        for j, i in enumerate(range(start, stop)):
+            semantic_sk, exp_sim = _text_sims(user, snap.skills_of(i), snap.desc_text(i), embed_func, None if desc_sims is None else float(desc_sims[i]))
+            cols[j, col["skills_sim"]] = 0.7 * semantic_sk + 0.3 * overlap[j]
+            cols[j, col["exp_sim"]] = exp_sim
+
+        cols[:, col["level_sim"]] = level_table[snap.level_codes[start:stop]]
+        cols[:, col["location_sim"]] = loc_table[snap.location_codes[start:stop]]
+
+        # Salary
+        salary = snap.salary[start:stop].astype(np.float64)
+        cols[:, col["salary_sim"]] = 0.2
+        if sal_expected > 0:
+            cols[:, col["salary_sim"]] = np.where(salary > 0, np.minimum(1.0, salary / sal_expected), 0.2)
+
+        # Freshness buckets
+        cols[:, col["freshness_sim"]] = _freshness_sims(snap.posted_ts[start:stop], now)
+
+        cols[:, col["score"]] = sum(cols[:, col[_WEIGHT_FACTORS[name]]] * w for name, w in _WEIGHTS.items())
+
+    return fill
+
+
+def _snapshot_columns(
+    user: Dict[str, Any],
+    snap: VacancySnapshot,
+    embed_func: Callable[[List[str]], np.ndarray],
+) -> np.ndarray:
+    """Factor columns (_DETAIL_KEYS) for the whole snapshot"""
+    cols = np.zeros((len(snap), len(_DETAIL_KEYS)), dtype=np.float64)
+    if len(snap):
+        _snapshot_factors(user, snap, embed_func)(0, len(snap), cols)
+    return cols
+
+
 def generate_explanation(user: Dict[str, Any], vacancy: Dict[str, Any], details: Dict[str, float]) -> str:
     user_pos = str(user.get("position", "")).strip()
     job_title = str(vacancy.get("title", "")).strip()
@@ -376,12 +536,155 @@ def generate_explanation(user: Dict[str, Any], vacancy: Dict[str, Any], details:
     return text
 
 
-def recommend_jobs(user_json: Dict[str, Any], vacancies_json: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+_DETAIL_KEYS: Tuple[str, ...] = (
+    "score",
+    "skills_sim",
+    "exp_sim",
+    "level_sim",
+    "location_sim",
+    "salary_sim",
+    "freshness_sim",
+)
+
+
+def _jobs_page(user_json: Dict[str, Any], vacancies_json: List[Dict[str, Any]], page: Page) -> Dict[str, Any]:
+    """Result items for one page; the explanation needs only the vacancy, so stored scores suffice"""
+    items: List[Dict[str, Any]] = []
+    for pos, score in zip(page.rows.tolist(), page.scores.tolist()):
+        vac = vacancies_json[pos]
+        items.append({
+            "vacancy_id": vac.get("id"),
+            "score": round(score, 4),
+            "explanation": generate_explanation(user_json, vac, {}),
+        })
+    return {"items": items, "next_cursor": page.next_cursor, "total": page.total, "reset": page.reset}
+
+
+class FreshnessRanking:
+    """
+    Cached per-user ranking split into a static score and the freshness term.
+    Only freshness depends on the clock, so a stale ranking is refreshed by
+    re-applying the bucket lookup to the cached static scores in one vectorized
+    pass — and only once some vacancy has crossed a 3/7/30-day boundary.
+    """
+
+    def __init__(self, columns: np.ndarray, posted_ts: np.ndarray, labels: Optional[np.ndarray] = None, now: Optional[float] = None) -> None:
+        self._score = _DETAIL_KEYS.index("score")
+        self._fresh = _DETAIL_KEYS.index("freshness_sim")
+        columns = np.asarray(columns, dtype=np.float64)
+        self.static = columns[:, self._score] - _WEIGHTS["freshness"] * columns[:, self._fresh]
+        self.posted_ts = np.asarray(posted_ts, dtype=np.float64)
+        self.labels = labels
+        # (columns, order, valid_until) is replaced as a whole, so readers never see a half-refreshed state
+        self._state = self._rank(columns, time.time() if now is None else now)
+
+    def _rank(self, columns: np.ndarray, now: float) -> Tuple[np.ndarray, np.ndarray, float]:
+        columns = columns.copy()
+        fresh = _freshness_sims(self.posted_ts, now)
+        columns[:, self._fresh] = fresh
+        columns[:, self._score] = self.static + _WEIGHTS["freshness"] * fresh
+        order = collapse_order(np.argsort(-np.round(columns[:, self._score], 4), kind="stable"), self.labels)
+        expiry = _freshness_expiry(self.posted_ts, now)
+        return columns, order, float(expiry.min()) if expiry.size else np.inf
+
+    def current(self, now: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(columns, order) valid at `now`; re-ranks only after a bucket boundary passed."""
+        now = time.time() if now is None else now
+        columns, order, valid_until = self._state
+        if now > valid_until:
+            columns, order, valid_until = self._rank(columns, now)
+            self._state = (columns, order, valid_until)
+        return columns, order
+
+    @property
+    def valid_until(self) -> float:
+        return self._state[2]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory owned by the ranking; posted_ts and labels are shared with the snapshot"""
+        columns, order, _ = self._state
+        return int(columns.nbytes + order.nbytes + self.static.nbytes)
+
+
+def _top_k_jobs(
+    user_json: Dict[str, Any],
+    vacancies: Any,
+    fill: Callable[[int, int, np.ndarray], None],
+    top_k: int,
+    labels: Optional[np.ndarray],
+    scorer: ChunkedScorer,
+) -> List[Dict[str, Any]]:
+    """Chunked, memory-capped scoring (RECO_MAX_MEM_MB): only the top_k rows are kept"""
+    best = scorer.top_k(fill, top_k, _DETAIL_KEYS.index("score"), labels)
+    if os.getenv("RECO_DEBUG"):
+        print(f"CHUNKED {json.dumps(scorer.stats())}", file=sys.stderr)
+    results: List[Dict[str, Any]] = []
+    for pos, score, row in best:
+        vac = vacancies[pos]
+        results.append({
+            "vacancy_id": vac.get("id"),
+            "score": score,
+            "explanation": generate_explanation(user_json, vac, dict(zip(_DETAIL_KEYS, row.tolist()))),
+        })
+    return results
+
+
+def recommend_jobs(
+    user_json: Dict[str, Any],
+    vacancies_json: List[Dict[str, Any]],
+    page_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    top_k: Optional[int] = None,
+) -> Any:
+    """
+    Без page_size/cursor возвращает полный отсортированный список (как раньше).
+    С page_size возвращает {"items", "next_cursor", "total", "reset"}: рейтинг сохраняется
+    на сервере, следующие страницы — срез по курсору с объяснениями только для страницы.
+    Просроченный или чужой курсор не отдаёт молча первую страницу: рейтинг строится
+    заново, и в ответе reset=True.
+    С top_k (без пагинации) каталог оценивается блоками в пределах RECO_MAX_MEM_MB
+    и возвращаются только top_k лучших.
+    """
+    paged = page_size is not None or cursor is not None
+    if paged:
+        catalog = catalog_fingerprint(v.get("id") for v in vacancies_json)
+        profile = profile_fingerprint("jobs", user_json)
+    if cursor:
+        page = _RANKINGS.page(cursor, len(vacancies_json), page_size, catalog, profile)
+        if page is not None:
+            return _jobs_page(user_json, vacancies_json, page)
+        # Invalid/expired cursor, other user or changed catalog: rebuild the ranking and flag the reset
+
     embed = embed_backend  # choose embedding backend
 
+    if not paged and top_k is not None and top_k > 0:
+        scorer = ChunkedScorer(len(vacancies_json), len(_DETAIL_KEYS))
+        # Catalog-wide preparation counts against the same memory budget as the chunks
+        with scorer.tracking():
+            desc_sims = _bm25_desc_sims(user_json, vacancies_json) if desc_backend() == "bm25" else None
+            scorer.reserve(desc_sims)
+
+            def fill(start: int, stop: int, out: np.ndarray) -> None:
+                for j, i in enumerate(range(start, stop)):
+                    _, details = calculate_similarity(user_json, vacancies_json[i], embed, None if desc_sims is None else float(desc_sims[i]))
+                    out[j] = [details[k] for k in _DETAIL_KEYS]
+
+            return _top_k_jobs(user_json, vacancies_json, fill, top_k, _dedup_labels(vacancies_json), scorer)
+
+    desc_sims = _bm25_desc_sims(user_json, vacancies_json) if desc_backend() == "bm25" else None
+    labels = _dedup_labels(vacancies_json)
+
+    if paged:
+        scores = np.zeros((len(vacancies_json),), dtype=np.float64)
+        for i, vac in enumerate(vacancies_json):
+            scores[i], _ = calculate_similarity(user_json, vac, embed, None if desc_sims is None else float(desc_sims[i]))
+        page = _RANKINGS.first_page(scores, page_size or DEFAULT_PAGE_SIZE, labels, catalog, profile, reset=bool(cursor))
+        return _jobs_page(user_json, vacancies_json, page)
+
     results: List[Dict[str, Any]] = []
-    for vac in vacancies_json:
-        score, details = calculate_similarity(user_json, vac, embed)
+    for i, vac in enumerate(vacancies_json):
+        score, details = calculate_similarity(user_json, vac, embed, None if desc_sims is None else float(desc_sims[i]))
         explanation = generate_explanation(user_json, vac, details)
         results.append({
             "vacancy_id": vac.get("id"),
@@ -389,11 +692,107 @@ def recommend_jobs(user_json: Dict[str, Any], vacancies_json: List[Dict[str, Any
             "explanation": explanation,
         })
 
-    # Sort by score desc
-    results.sort(key=lambda x: x["score"], reverse=True)
+    # Sort by score desc, keep the best vacancy of each near-duplicate cluster
+    order = sorted(range(len(results)), key=lambda i: results[i]["score"], reverse=True)
+    return [results[i] for i in collapse_order(np.array(order, dtype=np.int64), labels).tolist()]
+
+
+def snapshot_ranking(user_json: Dict[str, Any], snap: VacancySnapshot) -> FreshnessRanking:
+    """Score the snapshot once for a user; reuse the result until the catalog changes."""
+    columns = _snapshot_columns(user_json, snap, embed_backend)
+    return FreshnessRanking(columns, snap.posted_ts, snap.dup_labels if dedup_enabled() else None)
+
+
+def recommend_jobs_snapshot(
+    user_json: Dict[str, Any],
+    snap: VacancySnapshot,
+    page_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    ranking: Optional[FreshnessRanking] = None,
+    top_k: Optional[int] = None,
+) -> Any:
+    """
+    recommend_jobs over a columnar snapshot (see reco_snapshot.load_snapshot).
+    Output format is the same; vacancy dicts are built only for returned items.
+    ranking: cached snapshot_ranking for this user (only freshness is re-applied).
+    top_k: without paging or a cached ranking, score in memory-capped chunks.
+    """
+    paged = page_size is not None or cursor is not None
+    if cursor:
+        page = _RANKINGS.page(cursor, len(snap), page_size, snap.fingerprint(), profile_fingerprint("jobs", user_json))
+        if page is not None:
+            return _jobs_page(user_json, snap, page)
+
+    if ranking is None and not paged and top_k is not None and top_k > 0:
+        labels = snap.dup_labels if dedup_enabled() else None
+        # Skill links drive fill()'s temporaries, so chunks are cut by links as well as rows
+        scorer = ChunkedScorer(len(snap), len(_DETAIL_KEYS), link_offsets=snap.skill_offsets)
+        with scorer.tracking():
+            return _top_k_jobs(user_json, snap, _snapshot_factors(user_json, snap, embed_backend, scorer.reserve), top_k, labels, scorer)
+
+    if ranking is None:
+        ranking = snapshot_ranking(user_json, snap)
+    columns, order = ranking.current()
+    if paged:
+        page = _RANKINGS.first_page(
+            columns[:, _DETAIL_KEYS.index("score")],
+            page_size or DEFAULT_PAGE_SIZE,
+            ranking.labels,
+            snap.fingerprint(),
+            profile_fingerprint("jobs", user_json),
+            reset=bool(cursor),
+        )
+        return _jobs_page(user_json, snap, page)
+
+    score_col = columns[:, _DETAIL_KEYS.index("score")]
+    results: List[Dict[str, Any]] = []
+    for pos in order[:top_k if top_k is not None and top_k > 0 else None].tolist():
+        vac = snap[pos]
+        details = dict(zip(_DETAIL_KEYS, columns[pos].tolist()))
+        results.append({
+            "vacancy_id": vac["id"],
+            "score": round(float(score_col[pos]), 4),
+            "explanation": generate_explanation(user_json, vac, details),
+        })
     return results
 
 
+def recommend_jobs_variants(
+    user_json: Dict[str, Any],
+    vacancies_json: List[Dict[str, Any]],
+    variants: Dict[str, Dict[str, float]],
+    top_k: Optional[int] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Рейтинги для нескольких наборов весов (A/B, подбор весов) за один расчёт факторов.
+    variants: arm → частичные веса поверх _WEIGHTS, например {"b": {"freshness": 0.2}}.
+    """
+    embed = embed_backend  # choose embedding backend
+    desc_sims = _bm25_desc_sims(user_json, vacancies_json) if desc_backend() == "bm25" else None
+
+    names = list(_WEIGHT_FACTORS)
+    factors = np.zeros((len(vacancies_json), len(names)), dtype=np.float64)
+    for i, vac in enumerate(vacancies_json):
+        _, details = calculate_similarity(user_json, vac, embed, None if desc_sims is None else float(desc_sims[i]))
+        factors[i] = [details[_WEIGHT_FACTORS[n]] for n in names]
+
+    explanations: Dict[int, str] = {}
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for arm, (order, scores) in rank_variants(factors, names, variants, _WEIGHTS, top_k, _dedup_labels(vacancies_json)).items():
+        items: List[Dict[str, Any]] = []
+        for pos, score in zip(order.tolist(), scores.tolist()):
+            vac = vacancies_json[pos]
+            if pos not in explanations:
+                explanations[pos] = generate_explanation(user_json, vac, {})
+            items.append({
+                "vacancy_id": vac.get("id"),
+                "score": round(float(score), 4),
+                "explanation": explanations[pos],
+            })
+        out[arm] = items
+    return out
+
+
 if __name__ == "__main__":
     payload = os.getenv("RECO_PAYLOAD")
     if payload:
@@ -401,7 +800,16 @@ if __name__ == "__main__":
             data = json.loads(payload)
             user = data.get("user", {})
             vacancies = data.get("vacancies", [])
-            out = recommend_jobs(user, vacancies)
+            snapshot_path = data.get("snapshot") or os.getenv("RECO_SNAPSHOT")
+            if snapshot_path and data.get("candidate_id"):
+                user = load_candidate_sqlite(snapshot_path, data["candidate_id"])
+            if snapshot_path and not vacancies:
+                snap = load_snapshot(snapshot_path)
+                out = recommend_jobs_snapshot(user, snap, page_size=data.get("page_size"), cursor=data.get("cursor"), top_k=data.get("top_k"))
+            elif data.get("variants"):
+                out = recommend_jobs_variants(user, vacancies, data["variants"], top_k=data.get("top_k"))
+            else:
+                out = recommend_jobs(user, vacancies, page_size=data.get("page_size"), cursor=data.get("cursor"), top_k=data.get("top_k"))
             # Print compact JSON for the Node caller
             print(json.dumps(out, ensure_ascii=False))
         except Exception as e:
@@ -0,0 +1,116 @@
+"""
+BM25 lexical scoring over an inverted index of vacancy descriptions.
+
+Индекс строится один раз на каталог:
+- токены берутся из общего кэша reco_tokenize (ID термов — int32, словарь
+  каталога закрепляется за постоянными ID; неизвестные токены запроса не совпадут)
+- словарь term → id, постинги в CSR-виде (term_offsets, post_docs int32, post_tf float32)
+- длины документов (float32) и средняя длина для нормировки
+Запрос трогает только постинги своих терминов: стоимость ∝ числу совпавших постингов.
+
+Индекс снимка (reco_snapshot) строится при загрузке снимка. Для JSON-каталогов
+индекс кэшируется по хешу текстов (cached_index): повторные запросы к тому же
+каталогу не перестраивают постинги.
+
+Окружение:
+  RECO_DESC_BACKEND — tfidf (по умолчанию) или bm25
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+from reco_tokenize import TOKENIZER
+
+
+_CACHE_SIZE = 4  # JSON catalogs kept indexed at once
+
+
+def desc_backend() -> str:
+    """
+    Бэкенд сходства описаний: tfidf (косинус, по умолчанию) или bm25.
+    Выбирается через RECO_DESC_BACKEND.
+    """
+    backend = os.getenv("RECO_DESC_BACKEND", "tfidf").strip().lower()
+    return backend if backend in ("tfidf", "bm25") else "tfidf"
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed corpus; scores are normalized to [0, 1] per query."""
+
+    def __init__(self, docs: List[str], k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = float(k1)
+        self.b = float(b)
+        self.n_docs = len(docs)
+        flat, offsets = TOKENIZER.encode_corpus(docs, pin=True)
+        self.doc_len = np.diff(offsets).astype(np.float32)
+        doc_of = np.repeat(np.arange(self.n_docs, dtype=np.int64), np.diff(offsets))
+
+        # Distinct (term, doc) pairs sorted by term, then doc: CSR postings with their counts
+        n = max(1, self.n_docs)
+        pairs, tf = np.unique(flat.astype(np.int64) * n + doc_of, return_counts=True)
+        terms, local = np.unique(pairs // n, return_inverse=True)
+        self.term_ids: Dict[int, int] = {int(g): i for i, g in enumerate(terms.tolist())}
+        self.vocab: Dict[str, int] = {TOKENIZER.tokens[g]: i for g, i in self.term_ids.items()}
+        self.post_docs = (pairs % n).astype(np.int32)
+        self.post_tf = tf.astype(np.float32)
+        df = np.bincount(local, minlength=len(terms)).astype(np.int64)
+        self.term_offsets = np.zeros((len(terms) + 1,), dtype=np.int64)
+        np.cumsum(df, out=self.term_offsets[1:])
+        self.idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        avgdl = float(self.doc_len.mean()) if self.n_docs else 0.0
+        # Per-document length norm: k1 * (1 - b + b * dl / avgdl)
+        self.len_norm = (self.k1 * (1.0 - self.b + self.b * self.doc_len / (avgdl or 1.0))).astype(np.float32)
+
+    def score(self, query: str) -> np.ndarray:
+        """Raw BM25 scores for every document (zeros where no query term matched)."""
+        scores = np.zeros((self.n_docs,), dtype=np.float32)
+        query_ids, query_tf = np.unique(TOKENIZER.ids(query), return_counts=True)
+        for gid, qtf in zip(query_ids.tolist(), query_tf.tolist()):
+            tid = self.term_ids.get(gid)
+            if tid is None:
+                continue
+            lo, hi = self.term_offsets[tid], self.term_offsets[tid + 1]
+            docs = self.post_docs[lo:hi]
+            tf = self.post_tf[lo:hi]
+            scores[docs] += qtf * self.idf[tid] * tf * (self.k1 + 1.0) / (tf + self.len_norm[docs])
+        return scores
+
+    def similarity(self, query: str) -> np.ndarray:
+        """BM25 scores scaled by the best match, so they can replace a [0, 1] cosine."""
+        scores = self.score(query)
+        top = float(scores.max()) if scores.size else 0.0
+        if top > 0:
+            scores /= top
+        return scores
+
+
+_cache: "OrderedDict[str, BM25Index]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def cached_index(docs: List[str]) -> BM25Index:
+    """BM25Index for docs, reused while the same texts (same order) come back"""
+    h = hashlib.sha1()
+    for doc in docs:
+        h.update((doc or "").encode("utf-8"))
+        h.update(b"\x1f")
+    key = h.hexdigest()
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+            return index
+    index = BM25Index(docs)
+    with _cache_lock:
+        _cache[key] = index
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
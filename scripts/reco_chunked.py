@@ -0,0 +1,266 @@
+"""
+Memory-capped top-k scoring over large catalogs.
+
+Каталог обходится блоками фиксированного размера. Размер блока выводится из
+бюджета памяти (RECO_MAX_MEM_MB) и ширины строки факторов. Буфер факторов
+выделяется один раз и переиспользуется для каждого блока. Оценки блока
+сливаются в ограниченную кучу top-k, так что в памяти держатся только k
+лучших позиций, а не весь список результатов. Порядок совпадает с
+устойчивой сортировкой: при равной оценке выигрывает меньшая позиция.
+С метками дубликатов в куче остаётся лучший представитель каждого кластера.
+
+Бюджет покрывает весь запрос: массивы на весь каталог, подготовленные до
+цикла (оценки BM25, жанры/актёры фильмов), вычитаются из бюджета
+(reserve), остаток делится на блоки. Стоимость строки блока — буфер факторов
+плюс временные массивы fill; если fill работает со связями переменной длины
+(навыки вакансии, CSR-смещения link_offsets), каждая связь тоже учитывается,
+и блок с длинными строками становится короче.
+
+Пиковая память сообщается в stats (tracemalloc при track_memory=True за весь
+запрос внутри tracking(), а также max RSS процесса), чтобы бюджет можно было
+проверить. Общие кэши процесса (токенизатор, индексы BM25, кластеры дубликатов)
+ограничены своими настройками и в бюджет запроса не входят.
+
+Окружение:
+  RECO_MAX_MEM_MB       — бюджет памяти запроса в МБ (по умолчанию 256)
+  RECO_TRACK_MEMORY     — 1: трассировать память каждого запроса (tracemalloc, медленнее)
+"""
+
+from __future__ import annotations
+
+import heapq
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+_ROW_BUFFERS = 24     # bytes per row of the reused score/offset/position buffers
+_ROW_OVERHEAD = 160   # bytes per row of fill() and heap-filter temporaries
+_LINK_OVERHEAD = 96   # bytes per variable-length link (e.g. a vacancy skill) of fill() temporaries
+_ENTRY_OVERHEAD = 200  # bytes per kept heap entry beyond its row copy
+
+_last = threading.local()
+
+
+def max_mem_bytes() -> int:
+    return int(float(os.getenv("RECO_MAX_MEM_MB", "256")) * 1024 * 1024)
+
+
+def track_memory_enabled() -> bool:
+    return os.getenv("RECO_TRACK_MEMORY", "0").strip().lower() in ("1", "on", "true", "yes")
+
+
+def chunk_rows(n_cols: int, budget_bytes: Optional[int] = None, n_items: Optional[int] = None, links_per_row: float = 0.0) -> int:
+    """Rows per chunk so that a float64 (rows × n_cols) buffer plus temporaries fit the budget"""
+    budget = max_mem_bytes() if budget_bytes is None else int(budget_bytes)
+    rows = max(1, int(budget // (n_cols * 8 + _ROW_BUFFERS + _ROW_OVERHEAD + links_per_row * _LINK_OVERHEAD)))
+    return max(1, min(rows, n_items)) if n_items is not None else rows
+
+
+def last_stats() -> Dict[str, Any]:
+    """stats() of the last ChunkedScorer.top_k run on the calling thread"""
+    return dict(getattr(_last, "stats", {}))
+
+
+def _max_rss_bytes() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # ru_maxrss is KiB on Linux
+    return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+
+
+class TopK:
+    """
+    Bounded min-heap of the k best (score, position, payload).
+    labels: cluster per position; only the best member of each cluster is kept.
+    """
+
+    def __init__(self, k: int, labels: Optional[np.ndarray] = None) -> None:
+        self.k = max(1, int(k))
+        self.labels = labels
+        # Entries are (score, -position, payload): the heap root is the weakest kept item
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._by_cluster: Dict[int, Tuple[float, int, Any]] = {}
+
+    def threshold(self) -> float:
+        return self._heap[0][0] if len(self._heap) >= self.k else -np.inf
+
+    def push(self, scores: np.ndarray, positions: np.ndarray, payload: Optional[Callable[[int], Any]] = None) -> None:
+        """
+        Fold one chunk in. payload(i) is called only for rows that enter the heap
+        (i is the row within the chunk).
+        """
+        # Positions only grow across chunks, so an equal score never displaces a kept item
+        candidates = np.nonzero(scores > self.threshold())[0]
+        for i in candidates[np.argsort(-scores[candidates], kind="stable")].tolist():
+            score, pos = float(scores[i]), int(positions[i])
+            if score <= self.threshold():
+                break
+            self._add((score, -pos, payload(i) if payload is not None else None))
+
+    def _add(self, entry: Tuple[float, int, Any]) -> None:
+        if self.labels is None:
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, entry)
+            else:
+                heapq.heapreplace(self._heap, entry)
+            return
+        cluster = int(self.labels[-entry[1]])
+        kept = self._by_cluster.get(cluster)
+        if kept is not None:
+            if entry[:2] <= kept[:2]:
+                return
+            # Better member of a kept cluster replaces it in place
+            self._heap[self._heap.index(kept)] = entry
+            heapq.heapify(self._heap)
+        elif len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        else:
+            evicted = heapq.heapreplace(self._heap, entry)
+            del self._by_cluster[int(self.labels[-evicted[1]])]
+        self._by_cluster[cluster] = entry
+
+    def items(self) -> List[Tuple[int, float, Any]]:
+        """(position, score, payload) by score desc, position asc"""
+        return [(-neg_pos, score, payload) for score, neg_pos, payload in sorted(self._heap, reverse=True)]
+
+
+class ChunkedScorer:
+    """
+    Drives fill(start, stop, out) over [0, n_items) in budget-sized chunks;
+    `out` is one reused (chunk × n_cols) float64 buffer, column `score_col` ranks.
+    link_offsets: CSR offsets (n_items + 1) of per-row links that fill() expands
+    (e.g. vacancy skills); chunks are cut so that their links fit the budget too.
+    Catalog-wide preparation belongs inside tracking(); arrays it keeps for the
+    chunk loop are passed to reserve().
+    """
+
+    def __init__(
+        self,
+        n_items: int,
+        n_cols: int,
+        budget_bytes: Optional[int] = None,
+        track_memory: Optional[bool] = None,
+        link_offsets: Optional[np.ndarray] = None,
+    ) -> None:
+        self.n_items = int(n_items)
+        self.n_cols = int(n_cols)
+        self.budget_bytes = max_mem_bytes() if budget_bytes is None else int(budget_bytes)
+        self.link_offsets = link_offsets
+        self.track_memory = track_memory_enabled() if track_memory is None else bool(track_memory)
+        self.rows = chunk_rows(self.n_cols, self.budget_bytes, self.n_items, self._links_per_row())
+        self._reserved = 0
+        self._tracking = False
+        self._baseline = 0
+        self._stats: Dict[str, Any] = {}
+
+    def _links_per_row(self) -> float:
+        if self.link_offsets is None or self.n_items == 0:
+            return 0.0
+        return float(self.link_offsets[self.n_items] - self.link_offsets[0]) / self.n_items
+
+    def _links(self, start: int, stop: int) -> int:
+        return 0 if self.link_offsets is None else int(self.link_offsets[stop] - self.link_offsets[start])
+
+    def reserve(self, *arrays: Optional[np.ndarray]) -> None:
+        """Catalog-wide arrays held across the chunk loop; their bytes come off the chunk budget"""
+        self._reserved += sum(int(a.nbytes) for a in arrays if a is not None)
+
+    @contextmanager
+    def tracking(self) -> Iterator["ChunkedScorer"]:
+        """Span of one request: with track_memory, its peak covers everything allocated inside"""
+        started = self.track_memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            self._baseline = tracemalloc.get_traced_memory()[0]
+        self._tracking = True
+        try:
+            yield self
+        finally:
+            self._tracking = False
+            if started:
+                tracemalloc.stop()
+
+    def _held_bytes(self) -> int:
+        """Bytes already taken when the chunk loop starts: reserved arrays, or traced if that is larger"""
+        held = self._reserved
+        if self.track_memory and tracemalloc.is_tracing():
+            held = max(held, tracemalloc.get_traced_memory()[0] - self._baseline)
+        return held
+
+    def _chunk_stop(self, start: int, rows: int, room: int) -> int:
+        """Largest stop ≤ start + rows whose row and link temporaries fit `room` (at least one row)"""
+        lo, hi = 1, min(rows, self.n_items - start)
+        if self.link_offsets is None or hi * _ROW_OVERHEAD + self._links(start, start + hi) * _LINK_OVERHEAD <= room:
+            return start + hi
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if mid * _ROW_OVERHEAD + self._links(start, start + mid) * _LINK_OVERHEAD <= room:
+                lo = mid
+            else:
+                hi = mid - 1
+        return start + lo
+
+    def top_k(
+        self,
+        fill: Callable[[int, int, np.ndarray], None],
+        k: int,
+        score_col: int = 0,
+        labels: Optional[np.ndarray] = None,
+        keep_rows: bool = True,
+    ) -> List[Tuple[int, float, Optional[np.ndarray]]]:
+        """(position, rounded score, factor row copy or None) of the k best items"""
+        if not self._tracking:
+            with self.tracking():
+                return self.top_k(fill, k, score_col, labels, keep_rows)
+        k = max(1, int(k))
+        held = self._held_bytes()
+        kept = k * ((self.n_cols * 8 if keep_rows else 0) + _ENTRY_OVERHEAD)
+        room = max(0, self.budget_bytes - held - kept)
+        self.rows = chunk_rows(self.n_cols, room, self.n_items, self._links_per_row())
+        # Allocated once, reused by every chunk
+        buffer = np.zeros((self.rows, self.n_cols), dtype=np.float64)
+        scores = np.zeros((self.rows,), dtype=np.float64)
+        offsets = np.arange(self.rows, dtype=np.int64)
+        positions = np.zeros((self.rows,), dtype=np.int64)
+        buffer_bytes = int(buffer.nbytes + scores.nbytes + offsets.nbytes + positions.nbytes)
+        heap = TopK(k, labels)
+        chunks = 0
+        start = 0
+        while start < self.n_items:
+            stop = self._chunk_stop(start, self.rows, room - buffer_bytes)
+            m = stop - start
+            out = buffer[:m]
+            out.fill(0.0)
+            fill(start, stop, out)
+            # Rank on the rounded score, like the full-list sort
+            np.round(out[:, score_col], 4, out=scores[:m])
+            np.add(offsets[:m], start, out=positions[:m])
+            heap.push(scores[:m], positions[:m], (lambda i: out[i].copy()) if keep_rows else None)
+            chunks += 1
+            start = stop
+        peak = tracemalloc.get_traced_memory()[1] - self._baseline if self.track_memory else None
+        self._stats = {
+            "items": self.n_items,
+            "chunk_rows": self.rows,
+            "chunks": chunks,
+            "buffer_bytes": buffer_bytes,
+            "held_bytes": held,
+            "budget_bytes": self.budget_bytes,
+            "peak_traced_bytes": peak,
+            "max_rss_bytes": _max_rss_bytes(),
+        }
+        _last.stats = self._stats
+        return heap.items()
+
+    def stats(self) -> Dict[str, Any]:
+        """Chunking and memory figures of the last top_k() run"""
+        return dict(self._stats)
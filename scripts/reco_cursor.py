@@ -0,0 +1,275 @@
+"""
+Cursor-based pagination over a cached ranking.
+
+Первая страница считает полный рейтинг, сохраняет его на диск и отдаёт
+непрозрачный курсор. Следующие страницы — это срезы сохранённого массива:
+- на позицию хранятся только int32 индекс в каталоге и float64 оценка (12 байт)
+- факторы и объяснения пересчитываются только для строк страницы
+Глубокая пагинация стоит O(page_size), а не O(каталог).
+Курсор и рейтинг привязаны к отпечаткам каталога (id позиций по порядку) и
+профиля: курсор от другого каталога или пользователя отклоняется, и ответ
+строится заново с первой страницы с флагом reset.
+
+Хранилище ограничено по числу рейтингов и по байтам; свои рейтинги процесс
+вытесняет по очереди (сначала просроченные, затем самые старые), а полный
+обход каталога — только раз в min(TTL, 5 минут) для файлов других процессов.
+
+Окружение:
+  RECO_CURSOR_DIR           — каталог для рейтингов (по умолчанию tmp/eqwip_reco_cursors)
+  RECO_CURSOR_TTL_S         — время жизни рейтинга в секундах (по умолчанию 1800)
+  RECO_CURSOR_MAX_RANKINGS  — максимум рейтингов на процесс (по умолчанию 1000)
+  RECO_CURSOR_MAX_MB        — лимит размера рейтингов на процесс (по умолчанию 256)
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from reco_dedup import collapse_order
+
+
+DEFAULT_PAGE_SIZE = 20
+
+# One stored entry per ranked item: catalog position and its score
+_RANKED_DTYPE = np.dtype([("pos", "<i4"), ("score", "<f8")])
+_SWEEP_INTERVAL_S = 300.0
+
+
+@dataclass
+class Page:
+    """One page of a cached ranking: catalog positions plus their scores."""
+    rows: np.ndarray          # int32 positions into the catalog
+    scores: np.ndarray        # float64 ranking score per row
+    next_cursor: Optional[str]
+    total: int
+    reset: bool = False       # the request's cursor was rejected and the ranking rebuilt from page 1
+
+
+def catalog_fingerprint(ids: Iterable[Any]) -> str:
+    """Hash of item ids in catalog order: rankings store positions, so order matters"""
+    h = hashlib.sha1()
+    for item_id in ids:
+        h.update(str(item_id).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def profile_fingerprint(kind: str, user: Dict[str, Any], **params: Any) -> str:
+    """Stable hash of a request: recommender kind, profile and extra params (catalog version, paging)"""
+    raw = json.dumps({"kind": kind, "user": user, "params": params}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _short(fp: str) -> str:
+    return (fp or "")[:16]
+
+
+def encode_cursor(ranking_id: str, offset: int, page_size: int, catalog: str = "", profile: str = "") -> str:
+    raw = json.dumps({"r": ranking_id, "o": int(offset), "p": int(page_size), "c": _short(catalog), "u": _short(profile)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[str, int, int, str, str]]:
+    """(ranking id, offset, page size, catalog fingerprint prefix, profile fingerprint prefix)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        ranking_id = str(data["r"])
+        if not ranking_id.isalnum():
+            return None
+        return ranking_id, max(0, int(data["o"])), max(1, int(data["p"])), str(data.get("c", "")), str(data.get("u", ""))
+    except Exception:
+        return None
+
+
+class RankingStore:
+    """
+    Disk-backed store of ranked (position, score) arrays keyed by an opaque ranking id.
+    Each ranking is one .npy file and a small JSON meta file.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        ttl_s: Optional[float] = None,
+        max_rankings: Optional[int] = None,
+        max_mb: Optional[float] = None,
+    ) -> None:
+        self.root = root or os.getenv("RECO_CURSOR_DIR") or os.path.join(tempfile.gettempdir(), "eqwip_reco_cursors")
+        self.ttl_s = float(os.getenv("RECO_CURSOR_TTL_S", "1800")) if ttl_s is None else float(ttl_s)
+        self.max_rankings = int(os.getenv("RECO_CURSOR_MAX_RANKINGS", "1000")) if max_rankings is None else int(max_rankings)
+        mb = float(os.getenv("RECO_CURSOR_MAX_MB", "256")) if max_mb is None else float(max_mb)
+        self.max_bytes = int(mb * 1024 * 1024)
+        # Rankings written by this process, oldest first: (created, ranking id, bytes)
+        self._own: Deque[Tuple[float, str, int]] = deque()
+        self._own_bytes = 0
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _path(self, ranking_id: str, suffix: str) -> str:
+        return os.path.join(self.root, f"{ranking_id}.{suffix}")
+
+    def _remove(self, ranking_id: str) -> None:
+        for suffix in ("rank.npy", "meta.json"):
+            try:
+                os.remove(self._path(ranking_id, suffix))
+            except OSError:
+                continue
+
+    def _evict(self, now: float, incoming: int) -> None:
+        """Drop own rankings from the head of the queue until TTL and limits hold (caller holds _lock)"""
+        while self._own:
+            created, ranking_id, size = self._own[0]
+            over = len(self._own) + 1 > self.max_rankings or self._own_bytes + incoming > self.max_bytes
+            if not over and now - created <= self.ttl_s:
+                break
+            self._own.popleft()
+            self._own_bytes -= size
+            self._remove(ranking_id)
+
+    def _sweep(self, now: float) -> None:
+        """Expire files left by other or restarted processes; runs at most once per sweep interval"""
+        if now - self._last_sweep < min(self.ttl_s, _SWEEP_INTERVAL_S):
+            return
+        self._last_sweep = now
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl_s:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def put(
+        self,
+        order: np.ndarray,
+        scores: np.ndarray,
+        n_items: Optional[int] = None,
+        catalog: str = "",
+        profile: str = "",
+    ) -> str:
+        """Persist ranked positions and their scores; returns the ranking id."""
+        ranked = np.empty((len(order),), dtype=_RANKED_DTYPE)
+        ranked["pos"] = order
+        ranked["score"] = scores
+        now = time.time()
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            self._evict(now, ranked.nbytes)
+            self._sweep(now)
+            ranking_id = uuid.uuid4().hex
+            self._own.append((now, ranking_id, int(ranked.nbytes)))
+            self._own_bytes += int(ranked.nbytes)
+        np.save(self._path(ranking_id, "rank.npy"), ranked)
+        # n_items is the catalog size; order may be shorter after duplicate collapsing
+        meta = {
+            "n_items": int(n_items if n_items is not None else order.shape[0]),
+            "catalog": catalog,
+            "profile": profile,
+        }
+        with open(self._path(ranking_id, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return ranking_id
+
+    def get(self, ranking_id: str) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+        """(ranked pos/score records, meta) or None if missing or expired"""
+        try:
+            with open(self._path(ranking_id, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if time.time() - os.path.getmtime(self._path(ranking_id, "meta.json")) > self.ttl_s:
+                return None
+            ranked = np.load(self._path(ranking_id, "rank.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if ranked.dtype != _RANKED_DTYPE:
+            return None
+        meta.setdefault("n_items", int(ranked.shape[0]))
+        return ranked, meta
+
+    def first_page(
+        self,
+        scores: np.ndarray,
+        page_size: int,
+        labels: Optional[np.ndarray] = None,
+        catalog: str = "",
+        profile: str = "",
+        reset: bool = False,
+    ) -> Page:
+        """
+        Rank by score (desc), persist the ranking and slice the first page.
+        labels: near-duplicate cluster per item; only the best member of each cluster is kept.
+        catalog / profile: fingerprints a later cursor must match (catalog_fingerprint, profile_fingerprint).
+        reset: set when this replaces a rejected cursor; reported back as Page.reset.
+        """
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+        # Same key as the full-list sort: score rounded to 4 places; stable for ties
+        order = collapse_order(np.argsort(-np.round(scores, 4), kind="stable"), labels).astype(np.int32)
+        ranked_scores = scores[order]
+        ranking_id = self.put(order, ranked_scores, n_items=len(scores), catalog=catalog, profile=profile)
+        page = self._slice(ranking_id, order, ranked_scores, 0, page_size, catalog, profile)
+        page.reset = reset
+        return page
+
+    def page(
+        self,
+        cursor: str,
+        n_items: int,
+        page_size: Optional[int] = None,
+        catalog: str = "",
+        profile: str = "",
+    ) -> Optional[Page]:
+        """
+        Slice the page a cursor points to; None if the cursor is invalid, expired or stale.
+        Callers then rebuild with first_page(..., reset=True) so clients see the restart.
+        """
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            return None
+        ranking_id, offset, cursor_page_size, cursor_catalog, cursor_profile = decoded
+        # Cheap check first: the cursor itself names the catalog and profile it was issued for
+        if cursor_catalog != _short(catalog) or cursor_profile != _short(profile):
+            return None
+        stored = self.get(ranking_id)
+        if stored is None:
+            return None
+        ranked, meta = stored
+        # The catalog (ids in the same order) and the profile must be the ones the ranking was built for
+        if int(meta["n_items"]) != n_items or meta.get("catalog", "") != catalog or meta.get("profile", "") != profile:
+            return None
+        return self._slice(ranking_id, ranked["pos"], ranked["score"], offset, page_size or cursor_page_size, catalog, profile)
+
+    def _slice(
+        self,
+        ranking_id: str,
+        order: np.ndarray,
+        scores: np.ndarray,
+        offset: int,
+        page_size: int,
+        catalog: str = "",
+        profile: str = "",
+    ) -> Page:
+        total = int(order.shape[0])
+        end = min(total, offset + max(1, int(page_size)))
+        next_cursor = encode_cursor(ranking_id, end, page_size, catalog, profile) if end < total else None
+        return Page(
+            rows=np.array(order[offset:end], dtype=np.int32),
+            scores=np.array(scores[offset:end], dtype=np.float64),
+            next_cursor=next_cursor,
+            total=total,
+        )
@@ -0,0 +1,175 @@
+"""
+Near-duplicate vacancy detection via MinHash signatures and LSH banding.
+
+Сигнатуры (64 × uint32) считаются по шинглам (пары слов) текста вакансии при
+построении индекса. Кандидаты в дубликаты ищутся через LSH: сигнатура режется
+на 16 полос по 4 значения, вакансии с совпавшей полосой попадают в одну корзину.
+Одинаковые сигнатуры схлопываются сразу (np.unique). Оценка Жаккара
+проверяется только внутри корзин и только против текущих корней кластеров
+корзины — без O(n²) прохода и без попарных матриц.
+
+Кластеры JSON-каталога кэшируются по хешу текстов (cached_clusters): повторные
+запросы к тому же каталогу не пересчитывают сигнатуры.
+
+Окружение:
+  RECO_DEDUP            — 0/off отключает схлопывание дубликатов (по умолчанию включено)
+  RECO_DEDUP_THRESHOLD  — порог оценки Жаккара для дубликатов (по умолчанию 0.7)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+
+_TOKEN_RE = re.compile(r"[\w]+")
+_SHINGLE = 2
+_NUM_PERM = 64
+_BANDS = 16
+_ROWS = _NUM_PERM // _BANDS
+_PRIME = np.uint64(4294967291)  # largest prime below 2^32: (a * h + b) stays within uint64
+_EMPTY = np.uint32(0xFFFFFFFF)
+_CACHE_SIZE = 4  # JSON catalogs kept clustered at once
+
+_rng = np.random.default_rng(0x5EED)
+_PERM_A = _rng.integers(1, int(_PRIME), size=_NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, int(_PRIME), size=_NUM_PERM, dtype=np.uint64)
+
+
+def dedup_enabled() -> bool:
+    """Collapsing is on by default; RECO_DEDUP=0 turns it off"""
+    return os.getenv("RECO_DEDUP", "1").strip().lower() not in ("0", "off", "false", "no")
+
+
+def dedup_threshold() -> float:
+    return float(os.getenv("RECO_DEDUP_THRESHOLD", "0.7"))
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature (uint32 × 64) of word shingles; all-0xFFFFFFFF for empty text."""
+    toks = _TOKEN_RE.findall((text or "").lower())
+    if not toks:
+        return np.full((_NUM_PERM,), _EMPTY, dtype=np.uint32)
+    shingles = {" ".join(toks[i:i + _SHINGLE]) for i in range(max(1, len(toks) - _SHINGLE + 1))}
+    h = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    ) % _PRIME
+    return ((_PERM_A[:, None] * h[None, :] + _PERM_B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    out = np.empty((len(texts), _NUM_PERM), dtype=np.uint32)
+    for i, text in enumerate(texts):
+        out[i] = minhash(text)
+    return out
+
+
+def _void_rows(a: np.ndarray) -> np.ndarray:
+    """Rows of a 2-D array as one opaque key each, for np.unique over whole rows"""
+    a = np.ascontiguousarray(a)
+    return a.view(np.dtype((np.void, a.dtype.itemsize * a.shape[1]))).ravel()
+
+
+def duplicate_clusters(signatures: np.ndarray, threshold: float = 0.7) -> np.ndarray:
+    """
+    Cluster label per item (int32): the lowest row index in its near-duplicate cluster.
+    Items without a signature (empty text) are never clustered.
+    """
+    sigs = np.asarray(signatures, dtype=np.uint32).reshape(-1, _NUM_PERM)
+    n = sigs.shape[0]
+    labels = np.arange(n, dtype=np.int32)
+    valid = np.nonzero(~(sigs == _EMPTY).all(axis=1))[0]
+    if valid.size < 2:
+        return labels
+
+    # Identical signatures are one cluster outright: work on distinct signatures,
+    # numbered by first occurrence so the smaller id is always the lower row
+    _, first, inverse = np.unique(_void_rows(sigs[valid]), return_index=True, return_inverse=True)
+    by_row = np.argsort(first, kind="stable")
+    uid = np.empty_like(by_row)
+    uid[by_row] = np.arange(by_row.size)
+    uniq = sigs[valid[first[by_row]]]
+    rep_row = valid[first[by_row]]
+    parent = np.arange(uniq.shape[0], dtype=np.int64)
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = int(parent[i])
+        return i
+
+    if uniq.shape[0] > 1:
+        for b in range(_BANDS):
+            _, bucket = np.unique(_void_rows(uniq[:, b * _ROWS:(b + 1) * _ROWS]), return_inverse=True)
+            order = np.argsort(bucket, kind="stable")
+            sorted_buckets = bucket[order]
+            starts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+            ends = np.r_[starts[1:], len(sorted_buckets)]
+            for lo, hi in zip(starts.tolist(), ends.tolist()):
+                if hi - lo < 2:
+                    continue
+                # Each member is compared only with the bucket's current cluster roots
+                roots: List[int] = []
+                for m in order[lo:hi].tolist():
+                    r = find(m)
+                    if r in roots:
+                        continue
+                    if roots:
+                        est = (uniq[roots] == uniq[m]).mean(axis=1)
+                        matched = [roots[j] for j in np.flatnonzero(est >= threshold).tolist()]
+                    else:
+                        matched = []
+                    top = min([r] + matched)
+                    for x in [r] + matched:
+                        parent[x] = top
+                    roots = [x for x in roots if x not in matched] + [top]
+
+    # Flatten the forest, then map every valid row to its cluster's lowest row
+    while True:
+        up = parent[parent]
+        if np.array_equal(up, parent):
+            break
+        parent = up
+    labels[valid] = rep_row[parent[uid[inverse.ravel()]]]
+    return labels
+
+
+_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def cached_clusters(texts: List[str], threshold: float = 0.7) -> np.ndarray:
+    """duplicate_clusters of the texts' signatures, reused while the same texts (same order) come back"""
+    h = hashlib.sha1(repr(float(threshold)).encode("ascii"))
+    for text in texts:
+        h.update((text or "").encode("utf-8"))
+        h.update(b"\x1f")
+    key = h.hexdigest()
+    with _cache_lock:
+        labels = _cache.get(key)
+        if labels is not None:
+            _cache.move_to_end(key)
+            return labels
+    labels = duplicate_clusters(minhash_signatures(texts), threshold)
+    labels.setflags(write=False)
+    with _cache_lock:
+        _cache[key] = labels
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return labels
+
+
+def collapse_order(order: np.ndarray, labels: Optional[np.ndarray]) -> np.ndarray:
+    """Keep only the first (best-ranked) member of each cluster, preserving rank order."""
+    if labels is None or len(order) == 0:
+        return order
+    _, first = np.unique(np.asarray(labels)[order], return_index=True)
+    return order[np.sort(first)]
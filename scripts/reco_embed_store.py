@@ -0,0 +1,122 @@
+"""
+Persistent catalog embedding matrix with an id → row map.
+
+Layout of the store directory:
+  vectors.f32    — raw float32 matrix (rows × dim), read through np.memmap
+  manifest.json  — {"model", "dim", "rows", "ids", "hashes"}; row i belongs to ids[i]
+
+The manifest is the checkpoint: it is replaced atomically only after the
+vectors it describes are flushed, so a crash never publishes partial rows.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+class EmbeddingStore:
+    def __init__(self, root: str, model: str = "", dim: int = 0, ids: Optional[List[str]] = None, hashes: Optional[List[str]] = None) -> None:
+        self.root = root
+        self.model = model
+        self.dim = int(dim)
+        self.ids: List[str] = list(ids or [])
+        self.hashes: List[str] = list(hashes or [])
+        self.rows: Dict[str, int] = {item_id: i for i, item_id in enumerate(self.ids)}
+        self._vectors: Optional[np.ndarray] = None
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.root, "vectors.f32")
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, "manifest.json")
+
+    @classmethod
+    def open(cls, root: Optional[str]) -> Optional["EmbeddingStore"]:
+        """Open an existing store; None if the directory has no manifest."""
+        if not root:
+            return None
+        try:
+            with open(os.path.join(root, "manifest.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        store = cls(root, meta.get("model", ""), meta.get("dim", 0), meta.get("ids", []), meta.get("hashes", []))
+        if len(store.hashes) != len(store.ids):
+            return None
+        return store
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Read-only (rows × dim) memmap of the published rows."""
+        if self._vectors is None:
+            if not self.ids or self.dim <= 0:
+                self._vectors = np.zeros((0, max(self.dim, 0)), dtype=np.float32)
+            else:
+                self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.ids), self.dim))
+        return self._vectors
+
+    def row_of(self, item_id: str, text_digest: Optional[str] = None) -> int:
+        """Row of an item, or -1 if missing (or stale when text_digest is given)."""
+        row = self.rows.get(item_id, -1)
+        if row >= 0 and text_digest is not None and self.hashes[row] != text_digest:
+            return -1
+        return row
+
+    def is_current(self, item_id: str, text_digest: str) -> bool:
+        return self.row_of(item_id, text_digest) >= 0
+
+    def reset(self, model: str) -> None:
+        """Drop all rows; an empty manifest is published before the vectors file goes away."""
+        self.model = model
+        self.dim = 0
+        self.ids, self.hashes, self.rows = [], [], {}
+        self._vectors = None
+        self.checkpoint()
+        if os.path.exists(self.vectors_path):
+            os.remove(self.vectors_path)
+
+    def write(self, ids: List[str], hashes: List[str], vectors: np.ndarray) -> None:
+        """Write (or overwrite) rows for a batch; call checkpoint() to publish them."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim == 0:
+            self.dim = int(vectors.shape[1])
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim changed: {vectors.shape[1]} != {self.dim}")
+        os.makedirs(self.root, exist_ok=True)
+        self._vectors = None
+        mode = "r+b" if os.path.exists(self.vectors_path) else "w+b"
+        with open(self.vectors_path, mode) as f:
+            for item_id, digest, vec in zip(ids, hashes, vectors):
+                row = self.rows.get(item_id)
+                if row is None:
+                    row = len(self.ids)
+                    self.rows[item_id] = row
+                    self.ids.append(item_id)
+                    self.hashes.append(digest)
+                else:
+                    self.hashes[row] = digest
+                f.seek(row * self.dim * 4)
+                f.write(vec.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def checkpoint(self) -> None:
+        """Atomically publish the manifest for everything written so far."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "dim": self.dim, "rows": len(self.ids), "ids": self.ids, "hashes": self.hashes}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
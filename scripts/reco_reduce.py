@@ -0,0 +1,426 @@
+"""
+Fixed-width dense vectors for TF-IDF: sparse random projection or truncated SVD.
+
+Проекция обучается один раз на корпус (словарь, IDF и проекция vocab → dim) и
+сохраняется в .npz. Онлайн текст токенизируется по словарю корпуса, и его
+TF-IDF сразу проецируется в dim-мерное пространство (128–512): строки матрицы
+проекции суммируются с весами TF-IDF, широкая матрица не строится.
+
+- srp — разреженная случайная проекция (Achlioptas / Li): элементы {-1, 0, +1},
+  плотность 1/sqrt(vocab); обучение не смотрит на данные, кроме словаря.
+  Хранятся только ненулевые элементы (CSR: столбцы и знаки), ~dim·sqrt(vocab)
+  вместо vocab × dim
+- svd — рандомизированный усечённый SVD (Halko et al.) матрицы TF-IDF корпуса;
+  матрица хранится в CSR, плотная docs × vocab не строится
+
+Качество проверяется ranking_fidelity: доля общих top-k соседей по косинусу
+в полном и сжатом пространствах.
+
+Проекция обучается на тексты одного рекомендателя и помечается его видом
+(--kind); у вакансий и фильмов свои настройки, и файл чужого вида не применяется.
+
+Окружение:
+  RECO_TFIDF_REDUCER_JOBS   — проекция для рекомендаций вакансий (.npz)
+  RECO_TFIDF_REDUCER_MOVIES — проекция для рекомендаций фильмов (.npz)
+  Без настройки — TF-IDF во всю ширину словаря.
+
+Пример обучения:
+  python scripts/reco_reduce.py --catalog movies.json --kind movies --dim 256 --method svd --out data/tfidf_reducer_movies.npz
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from reco_tokenize import TOKENIZER
+
+
+METHODS = ("srp", "svd")
+KINDS = ("jobs", "movies")
+
+
+class SparseProjection:
+    """
+    Sparse random projection kept as its nonzeros: per term (CSR row) the target
+    columns and ±1 signs; every nonzero has the same magnitude `scale`.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, signs: np.ndarray, dim: int, scale: float) -> None:
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.signs = np.asarray(signs, dtype=np.int8)
+        self.scale = float(scale)
+        self.shape = (int(self.indptr.size - 1), int(dim))
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.indptr.nbytes + self.indices.nbytes + self.signs.nbytes)
+
+    def project(self, term_ids: np.ndarray, weights: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Sum of weighted projection rows per document: term_ids/weights are flat
+        (term, weight) pairs grouped by document via offsets (len(docs) + 1).
+        """
+        n_docs, dim = int(offsets.size - 1), self.shape[1]
+        lo = self.indptr[term_ids]
+        counts = self.indptr[term_ids + 1] - lo
+        # Expand every (doc, term) pair into the term's nonzeros
+        pair = np.repeat(np.arange(term_ids.size, dtype=np.int64), counts)
+        nz = np.arange(pair.size, dtype=np.int64) + np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        doc = np.repeat(np.arange(n_docs, dtype=np.int64), np.diff(offsets))[pair]
+        values = weights[pair] * self.signs[nz] * self.scale
+        out = np.bincount(doc * dim + self.indices[nz], weights=values, minlength=n_docs * dim)
+        return out.reshape(n_docs, dim).astype(np.float32)
+
+
+def sparse_random_projection(n_features: int, dim: int, seed: int = 0) -> SparseProjection:
+    """
+    (n_features × dim) projection with entries ±1/sqrt(density·dim) at density 1/sqrt(n_features).
+    Only the nonzeros are drawn: a binomial count per term, then its columns and signs,
+    so memory is O(dim·sqrt(n_features)) rather than a dense vocab × dim draw.
+    """
+    rng = np.random.default_rng(seed)
+    density = 1.0 / np.sqrt(max(1, n_features))
+    scale = 1.0 / np.sqrt(density * dim)
+    counts = rng.binomial(dim, density, size=n_features)
+    rows = np.repeat(np.arange(n_features, dtype=np.int64), counts)
+    # Columns are drawn with replacement; a repeat within a row is dropped (rare at this density)
+    keys = np.unique(rows * dim + rng.integers(0, dim, size=rows.size))
+    indptr = np.zeros((n_features + 1,), dtype=np.int64)
+    np.cumsum(np.bincount(keys // dim, minlength=n_features), out=indptr[1:])
+    signs = (rng.integers(0, 2, size=keys.size, dtype=np.int8) * 2 - 1).astype(np.int8)
+    return SparseProjection(indptr, keys % dim, signs, dim, scale)
+
+
+class CsrMatrix:
+    """
+    Minimal CSR matrix (float32 values) with products against dense matrices:
+    enough for randomized SVD and cosine queries without densifying the rows.
+    """
+
+    _BLOCK_NNZ = 1 << 20  # stored values per product block: bounds the (nnz × k) temporary
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, n_cols: int) -> None:
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float32)
+        self.shape = (int(self.indptr.size - 1), int(n_cols))
+        self._transpose: Optional["CsrMatrix"] = None
+
+    @property
+    def T(self) -> "CsrMatrix":
+        """Transpose (CSR of the columns), built once"""
+        if self._transpose is None:
+            order = np.argsort(self.indices, kind="stable")
+            rows = np.repeat(np.arange(self.shape[0], dtype=np.int64), np.diff(self.indptr))
+            indptr = np.zeros((self.shape[1] + 1,), dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=self.shape[1]), out=indptr[1:])
+            self._transpose = CsrMatrix(indptr, rows[order], self.data[order], self.shape[0])
+            self._transpose._transpose = self
+        return self._transpose
+
+    def row(self, i: int) -> np.ndarray:
+        out = np.zeros((self.shape[1],), dtype=np.float32)
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        out[self.indices[lo:hi]] = self.data[lo:hi]
+        return out
+
+    def normalize_rows(self) -> "CsrMatrix":
+        """Rows scaled to unit L2 (empty rows stay zero)"""
+        rows = np.repeat(np.arange(self.shape[0], dtype=np.int64), np.diff(self.indptr))
+        norms = np.sqrt(np.bincount(rows, weights=self.data.astype(np.float64) ** 2, minlength=self.shape[0]))
+        norms[norms == 0] = 1.0
+        return CsrMatrix(self.indptr, self.indices, self.data / norms[rows].astype(np.float32), self.shape[1])
+
+    def __matmul__(self, M: np.ndarray) -> np.ndarray:
+        M = np.asarray(M, dtype=np.float32)
+        vector = M.ndim == 1
+        M = M.reshape(M.shape[0], -1)
+        out = np.zeros((self.shape[0], M.shape[1]), dtype=np.float32)
+        # Row blocks of about _BLOCK_NNZ stored values: one (block nnz × k) temporary at a time
+        n_rows, start = self.shape[0], 0
+        while start < n_rows:
+            stop = int(np.searchsorted(self.indptr, self.indptr[start] + self._BLOCK_NNZ, side="right")) - 1
+            stop = min(n_rows, max(stop, start + 1))
+            lo, hi = self.indptr[start], self.indptr[stop]
+            if hi > lo:
+                offsets = self.indptr[start:stop + 1] - lo
+                nonempty = np.nonzero(np.diff(offsets))[0]
+                contrib = M[self.indices[lo:hi]] * self.data[lo:hi, None]
+                out[start + nonempty] = np.add.reduceat(contrib, offsets[nonempty], axis=0)
+            start = stop
+        return out.ravel() if vector else out
+
+
+def randomized_svd(X: Any, dim: int, n_oversamples: int = 10, n_iter: int = 4, seed: int = 0) -> np.ndarray:
+    """
+    Top-`dim` right singular vectors of X as an (n_features × dim) float32 matrix.
+    X: dense array or CsrMatrix; only products X @ M and X.T @ M are used.
+    """
+    if not isinstance(X, CsrMatrix):
+        X = np.asarray(X, dtype=np.float32)
+    n_features = X.shape[1]
+    k = min(dim + n_oversamples, min(X.shape))
+    rng = np.random.default_rng(seed)
+    Q, _ = np.linalg.qr(X @ rng.standard_normal((n_features, k)).astype(np.float32))
+    # Power iterations sharpen the spectrum; re-orthonormalize each half step
+    for _ in range(n_iter):
+        Z, _ = np.linalg.qr(X.T @ Q)
+        Q, _ = np.linalg.qr(X @ Z)
+    # Q.T @ X, as (X.T @ Q).T: small (k × n_features)
+    _, _, Vt = np.linalg.svd((X.T @ Q).T, full_matrices=False)
+    components = np.zeros((n_features, dim), dtype=np.float32)
+    components[:, :min(dim, Vt.shape[0])] = Vt[:dim].T
+    return components
+
+
+def _normalize_rows(X: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (X / norms).astype(np.float32)
+
+
+class TfidfReducer:
+    """
+    Corpus vocabulary + IDF + projection; transform() maps texts to (n × dim) unit rows.
+    components: dense (vocab × dim) for svd, SparseProjection for srp.
+    kind: recommender the corpus came from ("jobs", "movies"; empty if unknown).
+    """
+
+    def __init__(
+        self,
+        vocab: List[str],
+        idf: np.ndarray,
+        components: Union[np.ndarray, SparseProjection],
+        method: str,
+        kind: str = "",
+    ) -> None:
+        self.vocab: Dict[str, int] = {tok: i for i, tok in enumerate(vocab)}
+        # Permanent tokenizer IDs for the fitted vocabulary: _remap is bounded by it
+        TOKENIZER.pin(vocab)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        if not isinstance(components, SparseProjection):
+            components = np.asarray(components, dtype=np.float32)
+        self.components = components
+        self.method = method
+        self.kind = kind
+        self._remap = np.zeros((0,), dtype=np.int64)
+        self._remap_lock = threading.Lock()
+
+    @property
+    def dim(self) -> int:
+        return int(self.components.shape[1])
+
+    @classmethod
+    def fit(cls, texts: List[str], dim: int = 256, method: str = "srp", seed: int = 0, kind: str = "") -> "TfidfReducer":
+        if method not in METHODS:
+            raise ValueError(f"Unknown reduction method: {method}")
+        flat, offsets = TOKENIZER.encode_corpus(texts, pin=True)
+        doc_of = np.repeat(np.arange(len(texts), dtype=np.int64), np.diff(offsets))
+        n_ids = int(flat.max()) + 1 if flat.size else 0
+        # Document frequency: count each distinct (doc, term) pair once
+        df = np.bincount(np.unique(doc_of * max(1, n_ids) + flat) % max(1, n_ids), minlength=n_ids)
+        term_ids = np.nonzero(df)[0]
+        vocab = [TOKENIZER.tokens[i] for i in term_ids.tolist()]
+        n_docs = max(1, len(texts))
+        # Same smoothed IDF as _simple_tfidf_embeddings
+        idf = np.log((n_docs + 1) / (df[term_ids].astype(np.float64) + 1)) + 1.0
+        # Placeholder projection until the real one is built (svd needs the reducer's TF-IDF)
+        reducer = cls(vocab, idf, np.zeros((0, dim), dtype=np.float32), method, kind)
+        if method == "srp":
+            reducer.components = sparse_random_projection(len(vocab), dim, seed)
+        else:
+            reducer.components = randomized_svd(reducer.tfidf_sparse(texts), dim, seed=seed)
+        return reducer
+
+    def _term_columns(self, ids: np.ndarray) -> np.ndarray:
+        """Corpus-vocabulary columns of shared tokenizer IDs (-1 for unknown and transient terms)"""
+        remap = self._remap
+        n = len(TOKENIZER.tokens)
+        if remap.size < n:
+            # Extend a local copy and index with it; the shared array is only ever swapped whole
+            extra = np.array([self.vocab.get(t, -1) for t in TOKENIZER.tokens[remap.size:n]], dtype=np.int64)
+            remap = np.concatenate([remap, extra])
+            with self._remap_lock:
+                if self._remap.size < remap.size:
+                    self._remap = remap
+        cols = np.full(ids.shape, -1, dtype=np.int64)
+        pinned = ids >= 0
+        cols[pinned] = remap[ids[pinned]]
+        return cols
+
+    def _weights(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Flat (term columns, tf-idf weights) per distinct in-vocabulary term and per-document offsets"""
+        flat, offsets = TOKENIZER.encode_corpus(texts)
+        cols = self._term_columns(flat)
+        doc_of = np.repeat(np.arange(len(texts), dtype=np.int64), np.diff(offsets))
+        known = cols >= 0
+        n_terms = max(1, len(self.vocab))
+        # (doc, term) pairs sorted by doc, with their counts
+        pairs, tf = np.unique(doc_of[known] * n_terms + cols[known], return_counts=True)
+        docs, term_ids = pairs // n_terms, pairs % n_terms
+        doc_offsets = np.searchsorted(docs, np.arange(len(texts) + 1))
+        max_tf = np.zeros((len(texts),), dtype=np.float32)
+        nonempty = np.nonzero(np.diff(doc_offsets))[0]
+        if nonempty.size:
+            max_tf[nonempty] = np.maximum.reduceat(tf, doc_offsets[nonempty])
+        weights = (0.5 + 0.5 * (tf / np.maximum(max_tf[docs], 1.0))) * self.idf[term_ids]
+        return term_ids, weights.astype(np.float32), doc_offsets.astype(np.int64)
+
+    def tfidf(self, texts: List[str]) -> np.ndarray:
+        """Full-width TF-IDF rows over the corpus vocabulary (unit L2)"""
+        term_ids, weights, offsets = self._weights(texts)
+        X = np.zeros((len(texts), len(self.vocab)), dtype=np.float32)
+        X[np.repeat(np.arange(len(texts)), np.diff(offsets)), term_ids] = weights
+        return _normalize_rows(X)
+
+    def tfidf_sparse(self, texts: List[str]) -> CsrMatrix:
+        """Same rows as tfidf() in CSR form: memory grows with the corpus, not docs × vocab"""
+        term_ids, weights, offsets = self._weights(texts)
+        return CsrMatrix(offsets, term_ids, weights, len(self.vocab)).normalize_rows()
+
+    def transform(self, texts: List[str]) -> np.ndarray:
+        """Projected TF-IDF (n × dim, unit L2) without materializing vocabulary-wide rows"""
+        term_ids, weights, offsets = self._weights(texts)
+        if isinstance(self.components, SparseProjection):
+            return _normalize_rows(self.components.project(term_ids, weights, offsets))
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if term_ids.size:
+            contrib = self.components[term_ids] * weights[:, None]
+            nonempty = np.nonzero(np.diff(offsets))[0]
+            out[nonempty] = np.add.reduceat(contrib, offsets[nonempty], axis=0)
+        return _normalize_rows(out)
+
+    def save(self, path: str) -> None:
+        vocab = list(self.vocab)
+        tmp = f"{path}.tmp.npz"
+        arrays: Dict[str, np.ndarray] = {"vocab": np.array(vocab, dtype=str), "idf": self.idf, "method": np.array(self.method), "kind": np.array(self.kind)}
+        if isinstance(self.components, SparseProjection):
+            p = self.components
+            arrays.update(indptr=p.indptr, indices=p.indices, signs=p.signs, dim=np.array(p.shape[1]), scale=np.array(p.scale))
+        else:
+            arrays["components"] = self.components
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TfidfReducer":
+        with np.load(path, allow_pickle=False) as data:
+            if "indices" in data.files:
+                components: Union[np.ndarray, SparseProjection] = SparseProjection(
+                    data["indptr"], data["indices"], data["signs"], int(data["dim"]), float(data["scale"])
+                )
+            else:
+                components = data["components"]
+            kind = str(data["kind"]) if "kind" in data.files else ""
+            return cls(data["vocab"].tolist(), data["idf"], components, str(data["method"]), kind)
+
+
+_LOADED: Dict[str, Tuple[Tuple[int, int], TfidfReducer]] = {}
+
+
+def active_reducer(kind: str) -> Optional[TfidfReducer]:
+    """
+    Reducer for one recommender from RECO_TFIDF_REDUCER_<KIND>, reloaded when the file changes;
+    None if unset, unreadable or fitted on another recommender's texts.
+    """
+    path = os.getenv(f"RECO_TFIDF_REDUCER_{kind.upper()}", "").strip()
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _LOADED.get(path)
+    if cached is not None and cached[0] == stamp:
+        reducer = cached[1]
+    else:
+        try:
+            reducer = TfidfReducer.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"TFIDF_REDUCER_ERR {str(e)[:200]}", file=sys.stderr)
+            return None
+        _LOADED[path] = (stamp, reducer)
+    if reducer.kind and reducer.kind != kind:
+        # Another corpus: its vocabulary and IDF do not describe this recommender's texts
+        return None
+    return reducer
+
+
+def ranking_fidelity(full: Any, reduced: np.ndarray, k: int = 10, n_queries: int = 256, seed: int = 0) -> Dict[str, float]:
+    """
+    How well the reduced space keeps cosine neighbours: for sampled catalog rows
+    as queries, mean overlap of top-k neighbours (self excluded) and mean
+    absolute cosine error over those neighbours. full: dense rows or CsrMatrix.
+    """
+    sparse = isinstance(full, CsrMatrix)
+    full = full.normalize_rows() if sparse else _normalize_rows(np.asarray(full, dtype=np.float32))
+    reduced = _normalize_rows(np.asarray(reduced, dtype=np.float32))
+    n = full.shape[0]
+    k = max(1, min(k, n - 1))
+    if n < 2:
+        return {"overlap_at_k": 1.0, "cosine_mae": 0.0, "k": k, "queries": 0}
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(n, size=min(n_queries, n), replace=False)
+    overlaps: List[float] = []
+    errors: List[float] = []
+    for q in queries.tolist():
+        sims_full = full @ (full.row(q) if sparse else full[q])
+        sims_red = reduced @ reduced[q]
+        sims_full[q] = sims_red[q] = -np.inf
+        top_full = np.argpartition(-sims_full, k - 1)[:k]
+        top_red = np.argpartition(-sims_red, k - 1)[:k]
+        overlaps.append(len(np.intersect1d(top_full, top_red)) / k)
+        errors.append(float(np.abs(sims_full[top_full] - sims_red[top_full]).mean()))
+    return {"overlap_at_k": round(float(np.mean(overlaps)), 4), "cosine_mae": round(float(np.mean(errors)), 4), "k": k, "queries": len(overlaps)}
+
+
+def _catalog_texts(items: List[Dict[str, Any]], kind: str) -> List[str]:
+    """Every text the recommender embeds for a catalog item"""
+    if kind == "movies":
+        from movie_recommender import _movie_plot_text
+
+        return [_movie_plot_text(m) for m in items]
+    from python_recommender import _experience_to_text, _job_desc_text, _join_skills
+
+    texts: List[str] = []
+    for v in items:
+        skills = v.get("skills", []) or []
+        texts.extend([_join_skills(skills), _experience_to_text({s: 1 for s in skills}), _job_desc_text(v)])
+    return texts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fit a TF-IDF dimensionality reduction on a catalog")
+    parser.add_argument("--catalog", required=True, help="JSON file: list of items or {\"movies\"|\"vacancies\": [...]}")
+    parser.add_argument("--kind", choices=KINDS, default="jobs")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--method", choices=METHODS, default="srp")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared by the fidelity check")
+    parser.add_argument("--out", required=True, help="Output .npz")
+    args = parser.parse_args()
+
+    with open(args.catalog, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("movies" if args.kind == "movies" else "vacancies", [])
+    texts = _catalog_texts([x for x in data if isinstance(x, dict)], args.kind)
+
+    reducer = TfidfReducer.fit(texts, args.dim, args.method, args.seed, args.kind)
+    reducer.save(args.out)
+    fidelity = ranking_fidelity(reducer.tfidf_sparse(texts), reducer.transform(texts), k=args.k, seed=args.seed)
+    print(json.dumps({"method": args.method, "kind": args.kind, "dim": reducer.dim, "vocab": len(reducer.vocab), "docs": len(texts), **fidelity}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
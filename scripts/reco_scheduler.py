@@ -0,0 +1,232 @@
+"""
+Priority request scheduler in front of the job/movie recommenders.
+
+- две очереди: interactive (загрузка страниц) и bulk (ночные дайджесты, подбор
+  для работодателей), у каждой свой пул потоков = лимит параллелизма
+- одинаковые запросы в полёте (один отпечаток профиля) разделяют одно вычисление;
+  если interactive-запрос совпал с ещё не начатым bulk-запросом, он не ждёт
+  bulk-очередь, а считается в interactive-пуле и отдаёт результат обоим
+- скоринг — чистый Python под GIL, поэтому bulk-запросы рекомендателей
+  (submit_jobs/submit_movies) считаются в отдельных процессах с пониженным
+  приоритетом (nice): у каждого свой GIL и свой JobRecommender/MovieRecommender
+  на тех же файлах, а планировщик ОС отдаёт процессор interactive-запросам.
+  Произвольные функции (submit) в bulk-очереди по-прежнему выполняются в потоке
+- время ожидания в очереди и полное время запроса собираются по каждой
+  очереди (stats())
+
+Окружение:
+  RECO_INTERACTIVE_WORKERS  — параллелизм interactive-очереди (по умолчанию 4)
+  RECO_BULK_WORKERS         — параллелизм bulk-очереди (по умолчанию 1)
+  RECO_BULK_PROCESSES       — 0/off: bulk-запросы рекомендателей в потоках этого процесса (по умолчанию процессы)
+  RECO_BULK_NICE            — прибавка nice для bulk-процессов (по умолчанию 10)
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+import numpy as np
+
+from reco_cursor import profile_fingerprint
+from reco_service import JobRecommender, MovieRecommender
+
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+_QUEUES = (INTERACTIVE, BULK)
+
+
+class _Entry:
+    __slots__ = ("future", "priority", "enqueued", "started", "promoted")
+
+    def __init__(self, priority: str) -> None:
+        self.future: Future = Future()
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.started = False
+        self.promoted = False
+
+
+class _QueueStats:
+    def __init__(self, window: int = 1000) -> None:
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self.pending = 0
+        self.waits_ms: Deque[float] = deque(maxlen=window)
+        self.latencies_ms: Deque[float] = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = np.array(self.waits_ms, dtype=np.float64)
+        latencies = np.array(self.latencies_ms, dtype=np.float64)
+        pct = (lambda q: round(float(np.percentile(waits, q)), 3)) if waits.size else (lambda q: 0.0)
+        lat = (lambda q: round(float(np.percentile(latencies, q)), 3)) if latencies.size else (lambda q: 0.0)
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "failed": self.failed,
+            "pending": self.pending,
+            "wait_ms_p50": pct(50),
+            "wait_ms_p99": pct(99),
+            "wait_ms_max": round(float(waits.max()), 3) if waits.size else 0.0,
+            "latency_ms_p50": lat(50),
+            "latency_ms_p99": lat(99),
+        }
+
+
+# Bulk worker process state: its own recommenders over the parent's files
+_worker: Dict[str, Any] = {}
+
+
+def _init_bulk_worker(jobs_path: Optional[str], movies_path: Optional[str], poll_s: float, nice: int) -> None:
+    if nice > 0 and hasattr(os, "nice"):
+        os.nice(nice)
+    if jobs_path:
+        _worker["jobs"] = JobRecommender(jobs_path, watch=True, poll_s=poll_s)
+    if movies_path:
+        _worker["movies"] = MovieRecommender(movies_path, watch=True, poll_s=poll_s)
+
+
+def _bulk_recommend(kind: str, user: Dict[str, Any], page_size: Optional[int], cursor: Optional[str]) -> Any:
+    return _worker[kind].recommend(user, page_size=page_size, cursor=cursor)
+
+
+class RecommendationScheduler:
+    def __init__(
+        self,
+        jobs: Optional[JobRecommender] = None,
+        movies: Optional[MovieRecommender] = None,
+        interactive_workers: Optional[int] = None,
+        bulk_workers: Optional[int] = None,
+        bulk_processes: Optional[bool] = None,
+    ) -> None:
+        self.jobs = jobs
+        self.movies = movies
+        limits = {
+            INTERACTIVE: interactive_workers or int(os.getenv("RECO_INTERACTIVE_WORKERS", "4")),
+            BULK: bulk_workers or int(os.getenv("RECO_BULK_WORKERS", "1")),
+        }
+        self._pools = {q: ThreadPoolExecutor(max_workers=max(1, limits[q]), thread_name_prefix=f"reco-{q}") for q in _QUEUES}
+        self._stats = {q: _QueueStats() for q in _QUEUES}
+        if bulk_processes is None:
+            bulk_processes = os.getenv("RECO_BULK_PROCESSES", "1").strip().lower() not in ("0", "off", "false", "no")
+        self._bulk_procs: Optional[ProcessPoolExecutor] = None
+        if bulk_processes and (jobs is not None or movies is not None):
+            # Spawned, not forked: this process already runs threads (pools, index watchers)
+            self._bulk_procs = ProcessPoolExecutor(
+                max_workers=max(1, limits[BULK]),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_bulk_worker,
+                initargs=(
+                    jobs.source_path if jobs is not None else None,
+                    movies.source_path if movies is not None else None,
+                    (jobs or movies).index.poll_s,
+                    int(os.getenv("RECO_BULK_NICE", "10")),
+                ),
+            )
+        self._inflight: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable[[], Any], priority: str = INTERACTIVE) -> Future:
+        """Schedule fn under a coalescing key; identical in-flight keys share one Future."""
+        if priority not in self._pools:
+            raise ValueError(f"Unknown queue: {priority}")
+        with self._lock:
+            stats = self._stats[priority]
+            stats.submitted += 1
+            existing = self._inflight.get(key)
+            if existing is not None and (existing.started or existing.priority == INTERACTIVE or priority == BULK):
+                stats.coalesced += 1
+                return existing.future
+            entry = _Entry(priority)
+            if existing is not None:
+                # Queued bulk twin: compute it interactively and hand the result to both callers
+                existing.promoted = True
+                entry.future.add_done_callback(lambda f, target=existing.future: _copy_result(f, target))
+            self._inflight[key] = entry
+            stats.pending += 1
+        self._pools[priority].submit(self._run, key, entry, fn)
+        return entry.future
+
+    def _run(self, key: str, entry: _Entry, fn: Callable[[], Any]) -> None:
+        stats = self._stats[entry.priority]
+        with self._lock:
+            stats.pending -= 1
+            if entry.promoted:
+                return
+            entry.started = True
+            stats.waits_ms.append((time.monotonic() - entry.enqueued) * 1000.0)
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                stats.failed += 1
+                self._release(key, entry)
+            entry.future.set_exception(e)
+            return
+        with self._lock:
+            stats.completed += 1
+            self._release(key, entry)
+        entry.future.set_result(result)
+
+    def _release(self, key: str, entry: _Entry) -> None:
+        self._stats[entry.priority].latencies_ms.append((time.monotonic() - entry.enqueued) * 1000.0)
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    def submit_jobs(self, user: Dict[str, Any], priority: str = INTERACTIVE, page_size: Optional[int] = None, cursor: Optional[str] = None) -> Future:
+        if self.jobs is None:
+            raise ValueError("Job recommender is not configured")
+        version = self.jobs.index.current().version
+        key = profile_fingerprint("jobs", user, version=version, page_size=page_size, cursor=cursor)
+        return self.submit(key, self._recommend_fn("jobs", self.jobs, user, priority, page_size, cursor), priority)
+
+    def submit_movies(self, user: Dict[str, Any], priority: str = INTERACTIVE, page_size: Optional[int] = None, cursor: Optional[str] = None) -> Future:
+        if self.movies is None:
+            raise ValueError("Movie recommender is not configured")
+        version = self.movies.index.current().version
+        key = profile_fingerprint("movies", user, version=version, page_size=page_size, cursor=cursor)
+        return self.submit(key, self._recommend_fn("movies", self.movies, user, priority, page_size, cursor), priority)
+
+    def _recommend_fn(self, kind: str, recommender: Any, user: Dict[str, Any], priority: str, page_size: Optional[int], cursor: Optional[str]) -> Callable[[], Any]:
+        """Interactive work runs in this process; bulk work in a worker process when available"""
+        if priority == BULK and self._bulk_procs is not None:
+            procs = self._bulk_procs
+            # The bulk thread only waits on the process, so it holds no GIL while scoring runs
+            return lambda: procs.submit(_bulk_recommend, kind, user, page_size, cursor).result()
+        return lambda: recommender.recommend(user, page_size=page_size, cursor=cursor)
+
+    def recommend_jobs(self, user: Dict[str, Any], priority: str = INTERACTIVE, **params: Any) -> Any:
+        return self.submit_jobs(user, priority, **params).result()
+
+    def recommend_movies(self, user: Dict[str, Any], priority: str = INTERACTIVE, **params: Any) -> Any:
+        return self.submit_movies(user, priority, **params).result()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-queue counters and queue wait percentiles (ms) over the recent window."""
+        with self._lock:
+            return {q: self._stats[q].snapshot() for q in _QUEUES}
+
+    def shutdown(self, wait: bool = True) -> None:
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+        if self._bulk_procs is not None:
+            self._bulk_procs.shutdown(wait=wait)
+
+
+def _copy_result(source: Future, target: Future) -> None:
+    if target.done():
+        return
+    exc = source.exception()
+    if exc is not None:
+        target.set_exception(exc)
+    else:
+        target.set_result(source.result())
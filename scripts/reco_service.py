@@ -0,0 +1,207 @@
+"""
+Long-running recommender objects with hot-reloadable indexes.
+
+Чтение всегда идёт из неизменяемого снимка индекса. Новый снимок строится в
+фоне и публикуется атомарной заменой ссылки (read-copy-update): присваивание
+атрибута атомарно, поэтому на горячем пути нет блокировок. Запрос, начатый
+на старом снимке, дорабатывает на нём; снимок освобождается, когда на него
+больше никто не ссылается.
+
+Для вакансий рейтинг пользователя кэшируется на версию снимка: повторный
+запрос только пересчитывает свежесть. Кэш ограничен по памяти
+(RECO_STATIC_CACHE_MB, по умолчанию 256) и очищается при публикации нового
+снимка, чтобы не держать ссылки на старые.
+
+Перезагрузка — вручную (reload / reload_async) или по изменению файла-манифеста
+(watch): mtime/размер опрашиваются фоновым потоком.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from movie_recommender import MovieCatalogIndex, recommend_movies
+from python_recommender import FreshnessRanking, recommend_jobs_snapshot, snapshot_ranking
+from reco_cursor import profile_fingerprint
+from reco_snapshot import VacancySnapshot, load_snapshot
+
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class IndexSnapshot(Generic[T]):
+    """Immutable published index: never mutated after the swap."""
+    version: int
+    built_at: float
+    source_stamp: Optional[Tuple[int, int]]
+    data: T
+
+
+def _file_stamp(path: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class HotIndex(Generic[T]):
+    """
+    Holds the current IndexSnapshot and rebuilds it with `loader`.
+    Readers call current() without locking; builders are serialized among themselves.
+    """
+
+    def __init__(self, loader: Callable[[], T], watch_path: Optional[str] = None, poll_s: float = 5.0) -> None:
+        self._loader = loader
+        self._watch_path = watch_path
+        self._poll_s = float(poll_s)
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._version = 0
+        self._snapshot: Optional[IndexSnapshot[T]] = None
+        self.reload()
+
+    @property
+    def poll_s(self) -> float:
+        return self._poll_s
+
+    def current(self) -> IndexSnapshot[T]:
+        # Single reference read: the caller keeps this snapshot alive for its whole request
+        snap = self._snapshot
+        assert snap is not None
+        return snap
+
+    def reload(self) -> IndexSnapshot[T]:
+        """Build a new snapshot and publish it; in-flight readers keep the old one."""
+        with self._build_lock:
+            stamp = _file_stamp(self._watch_path)
+            data = self._loader()
+            self._version += 1
+            snap = IndexSnapshot(self._version, time.time(), stamp, data)
+            self._snapshot = snap  # atomic reference swap
+        if os.getenv("RECO_DEBUG"):
+            print(f"INDEX_RELOAD version={snap.version}", file=sys.stderr)
+        return snap
+
+    def reload_async(self) -> threading.Thread:
+        thread = threading.Thread(target=self._safe_reload, name="reco-index-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def _safe_reload(self) -> None:
+        try:
+            self.reload()
+        except Exception as e:
+            # Keep serving the previous snapshot if the new one cannot be built
+            print(f"INDEX_RELOAD_ERR {str(e)[:200]}", file=sys.stderr)
+
+    def watch(self) -> None:
+        """Start polling the manifest file; a changed mtime/size triggers a background rebuild."""
+        if self._watcher is not None or not self._watch_path:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, name="reco-index-watch", daemon=True)
+        self._watcher.start()
+
+    def _watch_loop(self) -> None:
+        while not self._stop.wait(self._poll_s):
+            stamp = _file_stamp(self._watch_path)
+            if stamp is not None and stamp != self._snapshot.source_stamp:
+                self._safe_reload()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+
+class JobRecommender:
+    """
+    recommend_jobs over a hot-reloadable vacancy snapshot (SQLite, .npz or save_dir directory).
+    Per-user static rankings are cached per snapshot version; repeated requests
+    only re-apply freshness (see FreshnessRanking).
+    """
+
+    def __init__(self, snapshot_path: str, watch: bool = False, poll_s: float = 5.0, cache_mb: Optional[float] = None) -> None:
+        self.source_path = snapshot_path
+        self.index: HotIndex[VacancySnapshot] = HotIndex(lambda: load_snapshot(snapshot_path), snapshot_path, poll_s)
+        mb = float(os.getenv("RECO_STATIC_CACHE_MB", "256")) if cache_mb is None else float(cache_mb)
+        self._cache_bytes = int(mb * 1024 * 1024)
+        # Rankings of the current snapshot version only; a newer version clears them
+        self._rankings: Dict[str, FreshnessRanking] = {}
+        self._cache_version = -1
+        self._cached_bytes = 0
+        self._cache_lock = threading.Lock()
+        if watch:
+            self.index.watch()
+
+    def _ranking(self, user: Dict[str, Any], snap: IndexSnapshot[VacancySnapshot]) -> FreshnessRanking:
+        key = profile_fingerprint("jobs", user, version=snap.version)
+        ranking = self._rankings.get(key)  # lock-free hit path
+        if ranking is not None:
+            return ranking
+        ranking = snapshot_ranking(user, snap.data)
+        size = ranking.nbytes
+        if size <= self._cache_bytes:
+            # Insertion-ordered dict as a FIFO cache bounded by bytes; only misses take the lock
+            with self._cache_lock:
+                if snap.version > self._cache_version:
+                    # Drop the old version's rankings and their snapshot references
+                    self._rankings = {}
+                    self._cached_bytes = 0
+                    self._cache_version = snap.version
+                if snap.version == self._cache_version and key not in self._rankings:
+                    while self._rankings and self._cached_bytes + size > self._cache_bytes:
+                        self._cached_bytes -= self._rankings.pop(next(iter(self._rankings))).nbytes
+                    self._rankings[key] = ranking
+                    self._cached_bytes += size
+        return ranking
+
+    def recommend(self, user: Dict[str, Any], page_size: Optional[int] = None, cursor: Optional[str] = None) -> Any:
+        snap = self.index.current()
+        ranking = None if cursor else self._ranking(user, snap)
+        return recommend_jobs_snapshot(user, snap.data, page_size=page_size, cursor=cursor, ranking=ranking)
+
+    def close(self) -> None:
+        self.index.stop()
+
+
+@dataclass(frozen=True)
+class MovieCatalog:
+    movies: List[Dict[str, Any]]
+    index: MovieCatalogIndex
+
+
+def _load_movie_catalog(path: str) -> MovieCatalog:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    movies = data.get("movies", []) if isinstance(data, dict) else data
+    return MovieCatalog(movies, MovieCatalogIndex(movies))
+
+
+class MovieRecommender:
+    """recommend_movies over a hot-reloadable movie catalog (JSON file) with a prebuilt index."""
+
+    def __init__(self, catalog_path: str, watch: bool = False, poll_s: float = 5.0) -> None:
+        self.source_path = catalog_path
+        self.index: HotIndex[MovieCatalog] = HotIndex(lambda: _load_movie_catalog(catalog_path), catalog_path, poll_s)
+        if watch:
+            self.index.watch()
+
+    def recommend(self, user: Dict[str, Any], page_size: Optional[int] = None, cursor: Optional[str] = None) -> Any:
+        catalog = self.index.current().data
+        return recommend_movies(user, catalog.movies, page_size=page_size, cursor=cursor, index=catalog.index)
+
+    def close(self) -> None:
+        self.index.stop()
@@ -0,0 +1,362 @@
+"""
+Columnar snapshot of the vacancy catalog for the job recommender.
+
+Вместо JSON-списка словарей читаем выгрузку таблиц Prisma (Job/JobSkill/Skill)
+целиком в типизированные массивы:
+- строки (id, title, description и словари) — TextColumn: UTF-8 байты одним
+  буфером + int64 смещения (CSR), строка декодируется только по запросу;
+  длинное описание не раздувает остальные строки до своей ширины
+- уровень и локация — словарное кодирование (codes + dict)
+- навыки — CSR: skill_offsets (n+1) + skill_codes в словарь skill_dict
+- salary float32, posted_ts float64 (секунды epoch)
+
+Источники:
+  *.db / *.sqlite  — SQLite-файл с таблицами jobs, job_skills, skills (локальная замена БД)
+  *.npz            — тот же набор массивов, сохранённый save_npz
+  каталог          — колонки отдельными .npy (save_dir); открываются через
+                     np.load(mmap_mode="r"), в память читаются только
+                     страницы, которых касается блок скоринга
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from reco_bm25 import BM25Index, desc_backend
+from reco_cursor import catalog_fingerprint
+from reco_dedup import dedup_threshold, duplicate_clusters, minhash_signatures
+
+
+_MANIFEST = "CURRENT"
+
+_TEXT_FIELDS = (
+    "ids",
+    "titles",
+    "descriptions",
+    "level_dict",
+    "location_dict",
+    "skill_dict",
+)
+
+_ARRAY_FIELDS = (
+    "level_codes",
+    "location_codes",
+    "salary",
+    "posted_ts",
+    "skill_offsets",
+    "skill_codes",
+)
+
+
+class TextColumn:
+    """Strings as one UTF-8 byte buffer (uint8) plus int64 offsets (n + 1,); rows decode on access."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray) -> None:
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, values: Iterable[str]) -> "TextColumn":
+        encoded = [str(v).encode("utf-8") for v in values]
+        offsets = np.zeros((len(encoded) + 1,), dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0]) - 1
+
+    def __getitem__(self, i: Union[int, np.ndarray]) -> Union[str, List[str]]:
+        """One row as str, or a list of str for an integer index array"""
+        if isinstance(i, (int, np.integer)):
+            lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+            return self.data[lo:hi].tobytes().decode("utf-8")
+        return [self[int(j)] for j in np.asarray(i).tolist()]
+
+    def tolist(self) -> List[str]:
+        text = self.data.tobytes()
+        bounds = self.offsets.tolist()
+        return [text[lo:hi].decode("utf-8") for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes + self.offsets.nbytes)
+
+
+@dataclass
+class VacancySnapshot:
+    """Vacancy catalog as typed column arrays; rows are materialized only on demand."""
+    ids: TextColumn             # (n,)
+    titles: TextColumn          # (n,)
+    descriptions: TextColumn    # (n,)
+    level_codes: np.ndarray     # int8 (n,) → level_dict
+    level_dict: TextColumn      # code 0 = unknown
+    location_codes: np.ndarray  # int32 (n,) → location_dict
+    location_dict: TextColumn   # code 0 = unknown
+    salary: np.ndarray          # float32 (n,), 0 = not specified
+    posted_ts: np.ndarray       # float64 (n,), 0 = unknown
+    skill_offsets: np.ndarray   # int64 (n + 1,)
+    skill_codes: np.ndarray     # int32 (nnz,) → skill_dict
+    skill_dict: TextColumn
+    minhash: Optional[np.ndarray] = None     # uint32 (n, 64) MinHash of title/description/skills
+    dup_labels: Optional[np.ndarray] = None  # int32 (n,) near-duplicate cluster per vacancy
+    catalog_fp: Optional[str] = None         # catalog_fingerprint of ids, computed on first use
+    desc_index: Optional[BM25Index] = None   # BM25 postings over desc_text, built once per snapshot
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def fingerprint(self) -> str:
+        """Catalog fingerprint (ids in row order) that ranking cursors are tied to"""
+        if self.catalog_fp is None:
+            self.catalog_fp = catalog_fingerprint(self.ids.tolist())
+        return self.catalog_fp
+
+    def skills_of(self, i: int) -> List[str]:
+        lo, hi = self.skill_offsets[i], self.skill_offsets[i + 1]
+        return self.skill_dict[self.skill_codes[lo:hi]]
+
+    def desc_text(self, i: int) -> str:
+        """Same text as python_recommender._job_desc_text for the row"""
+        skills = ", ".join(s.strip().lower() for s in self.skills_of(i) if s.strip())
+        return f"{self.titles[i]} | {self.descriptions[i]} | {skills}"
+
+    def build_dedup(self, threshold: float = 0.7) -> None:
+        """Near-duplicate signatures and clusters, computed once per snapshot"""
+        if self.minhash is None:
+            self.minhash = minhash_signatures([self.desc_text(i) for i in range(len(self))])
+        self.dup_labels = duplicate_clusters(self.minhash, threshold)
+
+    def bm25(self) -> BM25Index:
+        """Description BM25 index; built at load in bm25 mode, otherwise on first use"""
+        if self.desc_index is None:
+            self.desc_index = BM25Index([self.desc_text(i) for i in range(len(self))])
+        return self.desc_index
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        """Row as a vacancy dict (same shape as the JSON payload) — for output/explanations only"""
+        return {
+            "id": self.ids[i],
+            "title": self.titles[i],
+            "description": self.descriptions[i],
+            "skills": self.skills_of(i),
+            "level": self.level_dict[int(self.level_codes[i])],
+            "location": self.location_dict[int(self.location_codes[i])],
+            "salary": float(self.salary[i]),
+            "posted_ts": float(self.posted_ts[i]),
+        }
+
+
+def _to_epoch_s(value: Any) -> float:
+    """Prisma SQLite DateTime: integer ms since epoch or ISO-8601 text"""
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value) / 1000.0
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _encode(values: List[str]) -> tuple:
+    """Dictionary-encode strings; code 0 is reserved for the empty value"""
+    vocab: Dict[str, int] = {"": 0}
+    codes = np.fromiter((vocab.setdefault(v, len(vocab)) for v in values), dtype=np.int32, count=len(values))
+    return codes, TextColumn.from_list(vocab)
+
+
+def load_sqlite(path: str, active_only: bool = True) -> VacancySnapshot:
+    """Bulk-read jobs, job_skills and skills from a Prisma SQLite database file."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        where = "WHERE isActive = 1" if active_only else ""
+        job_rows = conn.execute(
+            "SELECT id, title, description, experienceLevel, workFormat, location, isRemote, "
+            f"salaryMin, salaryMax, createdAt FROM jobs {where} ORDER BY rowid"
+        ).fetchall()
+        skill_rows = conn.execute("SELECT id, name FROM skills ORDER BY rowid").fetchall()
+        link_rows = conn.execute("SELECT jobId, skillId FROM job_skills").fetchall()
+    finally:
+        conn.close()
+
+    ids, titles, descs, levels, locations, salary, posted = ([] for _ in range(7))
+    for job_id, title, desc, level, work_format, location, is_remote, sal_min, sal_max, created in job_rows:
+        ids.append(job_id)
+        titles.append(title or "")
+        descs.append(desc or "")
+        levels.append(str(level or "").strip().lower())
+        remote = bool(is_remote) or str(work_format or "").upper() == "REMOTE"
+        locations.append("remote" if remote else str(location or "").strip().lower())
+        salary.append(float(sal_max or sal_min or 0))
+        posted.append(_to_epoch_s(created))
+
+    # Skills: dictionary from the skills table, CSR rows grouped by job
+    skill_code = {sid: code for code, (sid, _) in enumerate(skill_rows)}
+    job_row = {job_id: i for i, job_id in enumerate(ids)}
+    pairs = np.array(
+        [(job_row[j], skill_code[s]) for j, s in link_rows if j in job_row and s in skill_code],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    counts = np.bincount(pairs[:, 0], minlength=len(ids))
+    skill_offsets = np.zeros((len(ids) + 1,), dtype=np.int64)
+    np.cumsum(counts, out=skill_offsets[1:])
+
+    level_codes, level_dict = _encode(levels)
+    location_codes, location_dict = _encode(locations)
+    snap = VacancySnapshot(
+        ids=TextColumn.from_list(ids),
+        titles=TextColumn.from_list(titles),
+        descriptions=TextColumn.from_list(descs),
+        level_codes=level_codes.astype(np.int8),
+        level_dict=level_dict,
+        location_codes=location_codes,
+        location_dict=location_dict,
+        salary=np.array(salary, dtype=np.float32),
+        posted_ts=np.array(posted, dtype=np.float64),
+        skill_offsets=skill_offsets,
+        skill_codes=pairs[:, 1].astype(np.int32),
+        skill_dict=TextColumn.from_list(name for _, name in skill_rows),
+    )
+    snap.build_dedup(dedup_threshold())
+    if desc_backend() == "bm25":
+        snap.bm25()
+    return snap
+
+
+def load_candidate_sqlite(path: str, candidate_id: str) -> Dict[str, Any]:
+    """Candidate profile (CandidateProfile + CandidateSkill) as the recommender's user dict."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        row = conn.execute(
+            "SELECT id, title, location, salaryMin, preferences FROM candidate_profiles WHERE id = ?",
+            (candidate_id,),
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Candidate profile not found: {candidate_id}")
+        skills = conn.execute(
+            "SELECT s.name, cs.level FROM candidate_skills cs JOIN skills s ON s.id = cs.skillId WHERE cs.candidateId = ?",
+            (candidate_id,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    _, title, location, salary_min, preferences = row
+    try:
+        prefs = json.loads(preferences) if preferences else {}
+    except ValueError:
+        prefs = {}
+    return {
+        "id": candidate_id,
+        "position": title or "",
+        "skills": [name for name, _ in skills],
+        # CandidateSkill.level (1-5) stands in for years per skill
+        "experience": {name: int(level or 0) for name, level in skills},
+        "level": str(prefs.get("level", "")) if isinstance(prefs, dict) else "",
+        "location": location or "",
+        "salary_expectation": salary_min or 0,
+    }
+
+
+def _to_arrays(snapshot: VacancySnapshot) -> Dict[str, np.ndarray]:
+    """Flat name → array map for saving; text columns become <name>_data and <name>_offsets"""
+    arrays = {name: getattr(snapshot, name) for name in _ARRAY_FIELDS}
+    for name in _TEXT_FIELDS:
+        column = getattr(snapshot, name)
+        arrays[f"{name}_data"] = column.data
+        arrays[f"{name}_offsets"] = column.offsets
+    if snapshot.minhash is not None:
+        arrays["minhash"] = snapshot.minhash
+    return arrays
+
+
+def _from_arrays(get: Callable[[str], np.ndarray], names: Iterable[str]) -> VacancySnapshot:
+    fields: Dict[str, Any] = {name: get(name) for name in _ARRAY_FIELDS}
+    for name in _TEXT_FIELDS:
+        fields[name] = TextColumn(get(f"{name}_data"), get(f"{name}_offsets"))
+    snap = VacancySnapshot(**fields)
+    if "minhash" in names:
+        snap.minhash = get("minhash")
+    return snap
+
+
+def save_npz(snapshot: VacancySnapshot, path: str) -> None:
+    np.savez(path, **_to_arrays(snapshot))
+
+
+def load_npz(path: str) -> VacancySnapshot:
+    with np.load(path, allow_pickle=False) as data:
+        snap = _from_arrays(lambda name: data[name], data.files)
+    snap.build_dedup(dedup_threshold())
+    if desc_backend() == "bm25":
+        snap.bm25()
+    return snap
+
+
+def _current_generation(path: str) -> Optional[str]:
+    try:
+        with open(os.path.join(path, _MANIFEST), "r", encoding="utf-8") as f:
+            return str(json.load(f)["generation"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_dir(snapshot: VacancySnapshot, path: str) -> None:
+    """
+    One .npy file per column in a new generation subdirectory; the CURRENT
+    manifest is replaced last, so a reader sees either the old or the new set.
+    The previous generation is kept for readers that are still opening it.
+    """
+    os.makedirs(path, exist_ok=True)
+    generation = f"g{time.time_ns()}"
+    tmp = os.path.join(path, f".{generation}.tmp")
+    os.makedirs(tmp)
+    arrays = _to_arrays(snapshot)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arr), allow_pickle=False)
+    os.replace(tmp, os.path.join(path, generation))
+
+    previous = _current_generation(path)
+    manifest_tmp = os.path.join(path, f"{_MANIFEST}.tmp")
+    with open(manifest_tmp, "w", encoding="utf-8") as f:
+        json.dump({"generation": generation, "rows": len(snapshot), "fields": list(arrays)}, f)
+    os.replace(manifest_tmp, os.path.join(path, _MANIFEST))
+    for entry in os.listdir(path):
+        if entry.startswith("g") and entry not in (generation, previous):
+            shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+
+def load_dir(path: str) -> VacancySnapshot:
+    """Snapshot directory written by save_dir; columns are read-only memory maps."""
+    with open(os.path.join(path, _MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    base = os.path.join(path, str(manifest["generation"]))
+
+    def column(name: str) -> np.ndarray:
+        return np.load(os.path.join(base, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+
+    snap = _from_arrays(column, manifest.get("fields", []))
+    if len(snap) != int(manifest["rows"]):
+        raise ValueError(f"Snapshot {path}: {len(snap)} rows, manifest says {manifest['rows']}")
+    snap.build_dedup(dedup_threshold())
+    if desc_backend() == "bm25":
+        snap.bm25()
+    return snap
+
+
+def load_snapshot(path: str, active_only: bool = True) -> VacancySnapshot:
+    """Load a snapshot: save_dir directory (memory-mapped), .npz or SQLite."""
+    if os.path.isdir(path):
+        return load_dir(path)
+    if os.path.splitext(path)[1].lower() == ".npz":
+        return load_npz(path)
+    return load_sqlite(path, active_only=active_only)
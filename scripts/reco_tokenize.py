@@ -0,0 +1,174 @@
+"""
+Shared tokenizer with token-ID interning and a per-document cache.
+
+Токены (нижний регистр, предкомпилированный [\w]+) переводятся в int32 ID.
+Постоянные ID (>= 0) получают только словари, обученные на каталоге
+(pin: индекс BM25, TfidfReducer) — таблица растёт со словарём каталогов, а
+не с потоком запросов. Остальные токены получают временные отрицательные ID
+из ограниченной таблицы; при её переполнении она сбрасывается и начинается
+новая эпоха. Массив ID документа кэшируется по хешу его содержимого
+(blake2b), кэш ограничен по памяти и вытесняет самые старые записи (LRU);
+документ с временными ID прошлой эпохи токенизируется заново.
+
+Массовый режим (encode_corpus) отдаёт корпус как один плоский int32 массив и
+смещения документов; TF/IDF считаются на нём через np.bincount.
+
+Окружение:
+  RECO_TOKEN_CACHE_MB       — лимит памяти кэша документов (по умолчанию 64)
+  RECO_TOKEN_TRANSIENT_MAX  — размер таблицы временных токенов (по умолчанию 100000)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+_TOKEN_RE = re.compile(r"[\w]+")
+_ENTRY_OVERHEAD = 200  # bytes per cache entry beyond the array data: key, array header, dict slot
+_PINNED_ONLY = -1  # cache epoch of documents without transient IDs: valid in every epoch
+
+
+class Tokenizer:
+    """
+    Pinned (catalog) token IDs >= 0 are permanent; other tokens get negative
+    IDs from a bounded transient table that is cleared when full.
+    """
+
+    def __init__(self, cache_mb: Optional[float] = None, transient_max: Optional[int] = None) -> None:
+        mb = float(os.getenv("RECO_TOKEN_CACHE_MB", "64")) if cache_mb is None else float(cache_mb)
+        self.cache_bytes = int(mb * 1024 * 1024)
+        limit = int(os.getenv("RECO_TOKEN_TRANSIENT_MAX", "100000")) if transient_max is None else int(transient_max)
+        self.transient_max = max(1, limit)
+        self.vocab: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        self._transient: Dict[str, int] = {}
+        self._next_transient = 1
+        # Bumped when a transient ID stops meaning its token (table reset, token pinned)
+        self.epoch = 0
+        self._cache: "OrderedDict[bytes, Tuple[np.ndarray, int]]" = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _pin_locked(self, tok: str) -> int:
+        tid = len(self.tokens)
+        self.tokens.append(tok)
+        self.vocab[tok] = tid
+        if self._transient.pop(tok, None) is not None:
+            # Cached documents may still carry the token's transient ID
+            self.epoch += 1
+        return tid
+
+    def _transient_locked(self, tok: str) -> int:
+        tid = self._transient.get(tok)
+        if tid is None:
+            if len(self._transient) >= self.transient_max:
+                self._transient.clear()
+                self.epoch += 1
+            # IDs are not reused right after a reset, so stale documents cannot alias new tokens
+            tid = -self._next_transient
+            self._next_transient = self._next_transient % (2 ** 31 - 1) + 1
+            self._transient[tok] = tid
+        return tid
+
+    def pin(self, tokens: Iterable[str]) -> None:
+        """Give tokens permanent IDs (a fitted vocabulary that is matched by ID later)"""
+        with self._lock:
+            for tok in tokens:
+                if tok not in self.vocab:
+                    self._pin_locked(tok)
+
+    def _intern(self, toks: List[str], pin: bool) -> Tuple[np.ndarray, bool]:
+        """(IDs, whether any are transient)"""
+        vocab = self.vocab
+        out = np.empty((len(toks),), dtype=np.int32)
+        transient = False
+        for i, tok in enumerate(toks):
+            tid = vocab.get(tok)
+            if tid is None:
+                with self._lock:
+                    tid = vocab.get(tok)
+                    if tid is None:
+                        tid = self._pin_locked(tok) if pin else self._transient_locked(tok)
+                transient = transient or tid < 0
+            out[i] = tid
+        return out, transient
+
+    def ids(self, text: str, pin: bool = False) -> np.ndarray:
+        """
+        Token IDs of one text (read-only int32 array, shared via the cache).
+        pin: intern unknown tokens permanently (catalog fits); otherwise they are transient.
+        """
+        text = text or ""
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            arr, epoch = cached
+            if epoch == _PINNED_ONLY or (epoch == self.epoch and not pin):
+                self.hits += 1
+                with self._lock:
+                    if key in self._cache:
+                        self._cache.move_to_end(key)
+                return arr
+        self.misses += 1
+        epoch = self.epoch
+        arr, transient = self._intern(_TOKEN_RE.findall(text.lower()), pin)
+        arr.setflags(write=False)
+        size = arr.nbytes + _ENTRY_OVERHEAD
+        if size <= self.cache_bytes:
+            with self._lock:
+                old = self._cache.pop(key, None)
+                if old is not None:
+                    self._cached_bytes -= old[0].nbytes + _ENTRY_OVERHEAD
+                self._cache[key] = (arr, epoch if transient else _PINNED_ONLY)
+                self._cached_bytes += size
+                while self._cached_bytes > self.cache_bytes:
+                    _, (evicted, _) = self._cache.popitem(last=False)
+                    self._cached_bytes -= evicted.nbytes + _ENTRY_OVERHEAD
+        return arr
+
+    def encode_corpus(self, texts: List[str], pin: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Whole corpus as (flat int32 token IDs, int64 offsets of len(texts) + 1); pin as in ids()"""
+        docs = [self.ids(t, pin) for t in texts]
+        offsets = np.zeros((len(docs) + 1,), dtype=np.int64)
+        np.cumsum([d.size for d in docs], out=offsets[1:])
+        flat = np.concatenate(docs) if docs else np.zeros((0,), dtype=np.int32)
+        return flat.astype(np.int32, copy=False), offsets
+
+    def stats(self) -> Dict[str, int]:
+        return {"vocab": len(self.tokens), "transient": len(self._transient), "epoch": self.epoch, "cached_docs": len(self._cache), "cached_bytes": self._cached_bytes, "hits": self.hits, "misses": self.misses}
+
+
+TOKENIZER = Tokenizer()
+
+
+def tfidf_embeddings(texts: List[str], tokenizer: Optional[Tokenizer] = None) -> np.ndarray:
+    """
+    TF-IDF rows (unit L2) over the vocabulary of `texts`:
+    tf = 0.5 + 0.5 * count / max count in the doc, idf = log((n + 1) / (df + 1)) + 1.
+    """
+    flat, offsets = (tokenizer or TOKENIZER).encode_corpus(texts)
+    n_docs = len(texts)
+    if flat.size == 0:
+        return np.zeros((n_docs, 0), dtype=np.float32)
+    # Local columns: only terms present in this batch
+    terms, cols = np.unique(flat, return_inverse=True)
+    n_terms = terms.size
+    doc_of = np.repeat(np.arange(n_docs, dtype=np.int64), np.diff(offsets))
+    counts = np.bincount(doc_of * n_terms + cols, minlength=n_docs * n_terms).reshape(n_docs, n_terms).astype(np.float32)
+    df = np.count_nonzero(counts, axis=0)
+    idf = (np.log((max(1, n_docs) + 1) / (df + 1.0)) + 1.0).astype(np.float32)
+    max_tf = counts.max(axis=1, keepdims=True)
+    max_tf[max_tf == 0] = 1.0
+    X = np.where(counts > 0, (0.5 + 0.5 * (counts / max_tf)) * idf, 0.0).astype(np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (X / norms).astype(np.float32)
@@ -0,0 +1,108 @@
+"""Memory budget and ordering of chunked top-k scoring (reco_chunked) on the production fills."""
+
+import random
+
+import numpy as np
+import pytest
+
+import movie_recommender
+import python_recommender
+from reco_chunked import ChunkedScorer, last_stats
+from reco_snapshot import TextColumn, VacancySnapshot
+
+
+BUDGET_MB = 0.25
+WORDS = ["python", "java", "docker", "sql", "go", "rust", "react", "k8s", "aws", "linux"]
+
+
+def _snapshot(n_items: int, skills_per_row: int) -> VacancySnapshot:
+    rng = random.Random(0)
+    codes = [rng.sample(range(300), skills_per_row) for _ in range(n_items)]
+    offsets = np.zeros((n_items + 1,), dtype=np.int64)
+    np.cumsum([len(c) for c in codes], out=offsets[1:])
+    snap = VacancySnapshot(
+        ids=TextColumn.from_list(f"j{i}" for i in range(n_items)),
+        titles=TextColumn.from_list(f"Developer {i % 50}" for i in range(n_items)),
+        descriptions=TextColumn.from_list(" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(n_items)),
+        level_codes=np.array([rng.randint(0, 2) for _ in range(n_items)], dtype=np.int8),
+        level_dict=TextColumn.from_list(["", "junior", "middle"]),
+        location_codes=np.array([rng.randint(0, 2) for _ in range(n_items)], dtype=np.int32),
+        location_dict=TextColumn.from_list(["", "москва", "remote"]),
+        salary=np.array([rng.randint(0, 300000) for _ in range(n_items)], dtype=np.float32),
+        posted_ts=np.zeros((n_items,), dtype=np.float64),
+        skill_offsets=offsets,
+        skill_codes=np.concatenate(codes).astype(np.int32),
+        skill_dict=TextColumn.from_list(f"skill{i}" for i in range(300)),
+    )
+    snap.build_dedup()
+    return snap
+
+
+def _movies(n_items: int):
+    rng = random.Random(0)
+    genres = ["drama", "comedy", "thriller", "action", "horror", "romance"]
+    return [
+        {
+            "id": f"m{i}",
+            "title": f"Movie {i}",
+            "genres": rng.sample(genres, 2),
+            "cast": [f"Actor {rng.randint(0, 400)}" for _ in range(3)],
+            "plot": " ".join(rng.choice(WORDS) for _ in range(15)),
+            "rating": rng.uniform(5, 9),
+            "year": rng.randint(1980, 2020),
+        }
+        for i in range(n_items)
+    ]
+
+
+@pytest.fixture
+def tracked(monkeypatch):
+    monkeypatch.setenv("RECO_TRACK_MEMORY", "1")
+    monkeypatch.setenv("RECO_MAX_MEM_MB", str(BUDGET_MB))
+
+
+def _assert_within_budget():
+    stats = last_stats()
+    assert stats["chunks"] > 1
+    assert stats["peak_traced_bytes"] is not None
+    assert stats["peak_traced_bytes"] <= stats["budget_bytes"]
+
+
+@pytest.mark.parametrize("skills_per_row", [5, 12])
+def test_snapshot_top_k_within_budget(tracked, skills_per_row):
+    snap = _snapshot(3000, skills_per_row)
+    user = {"position": "Backend", "skills": ["skill1", "skill2"], "experience": {"skill1": 3}, "level": "middle", "location": "Москва", "salary_expectation": 150000}
+    # Warm-up fills the process-wide tokenizer cache, which has its own limit
+    python_recommender.recommend_jobs_snapshot(user, snap, top_k=10)
+    top = python_recommender.recommend_jobs_snapshot(user, snap, top_k=10)
+    _assert_within_budget()
+    assert top == python_recommender.recommend_jobs_snapshot(user, snap)[:10]
+
+
+def test_movies_top_k_within_budget(tracked):
+    movies = _movies(3000)
+    user = {"preferred_genres": ["drama"], "favorite_actors": ["Actor 7"], "preferred_themes": ["docker"]}
+    movie_recommender.recommend_movies(user, movies, top_k=10)
+    top = movie_recommender.recommend_movies(user, movies, top_k=10)
+    _assert_within_budget()
+    full = movie_recommender.recommend_movies(user, movies)[:10]
+    assert [m["movie_id"] for m in top] == [m["movie_id"] for m in full]
+
+
+def test_chunks_follow_link_counts():
+    # One row with many links gets a short chunk of its own instead of blowing the budget
+    offsets = np.zeros((1001,), dtype=np.int64)
+    links = np.full((1000,), 2, dtype=np.int64)
+    links[500] = 5000
+    np.cumsum(links, out=offsets[1:])
+    seen = []
+
+    def fill(start, stop, out):
+        seen.append((start, stop))
+        out[:, 0] = np.arange(start, stop)
+
+    scorer = ChunkedScorer(1000, 7, budget_bytes=256 * 1024, link_offsets=offsets)
+    scorer.top_k(fill, 5)
+    heavy = next((a, b) for a, b in seen if a <= 500 < b)
+    assert heavy[1] - heavy[0] < scorer.stats()["chunk_rows"]
+    assert seen[0][0] == 0 and seen[-1][1] == 1000
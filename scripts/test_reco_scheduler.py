@@ -0,0 +1,58 @@
+"""Interactive latency of the scheduler while bulk recommendations run (reco_scheduler)."""
+
+import threading
+import time
+
+import numpy as np
+
+import reco_snapshot
+from reco_scheduler import BULK, INTERACTIVE, RecommendationScheduler
+from reco_service import JobRecommender
+from test_reco_chunked import _snapshot
+
+
+def _user(i):
+    return {"position": f"Backend {i}", "skills": ["skill1", f"skill{i % 300}"], "experience": {"skill1": 3}, "level": "middle", "location": "Москва", "salary_expectation": 150000}
+
+
+def _interactive_p99(scheduler, bulk_load, n_requests=20):
+    stop = threading.Event()
+
+    def feeder():
+        i = 0
+        while not stop.is_set():
+            scheduler.submit_jobs(_user(10_000 + i), BULK).result()
+            i += 1
+
+    thread = threading.Thread(target=feeder)
+    if bulk_load:
+        thread.start()
+        # First bulk request starts the worker process and loads its snapshot
+        while scheduler.stats()[BULK]["completed"] < 1:
+            time.sleep(0.05)
+    latencies = []
+    for i in range(n_requests):
+        started = time.perf_counter()
+        scheduler.submit_jobs(_user(i), INTERACTIVE, page_size=10).result()
+        latencies.append((time.perf_counter() - started) * 1000.0)
+        time.sleep(0.01)
+    stop.set()
+    if bulk_load:
+        thread.join()
+    return float(np.percentile(latencies, 99))
+
+
+def test_interactive_p99_holds_under_bulk_load(tmp_path):
+    path = str(tmp_path / "snapshot")
+    reco_snapshot.save_dir(_snapshot(800, 6), path)
+    jobs = JobRecommender(path, cache_mb=0)
+    scheduler = RecommendationScheduler(jobs=jobs, interactive_workers=4, bulk_workers=1)
+    try:
+        alone = _interactive_p99(scheduler, bulk_load=False)
+        loaded = _interactive_p99(scheduler, bulk_load=True)
+        assert scheduler.stats()[BULK]["completed"] >= 1
+    finally:
+        scheduler.shutdown()
+        jobs.close()
+    # Bulk scoring runs in a low-priority worker process with its own GIL
+    assert loaded <= alone * 1.5 + 20.0, (alone, loaded)